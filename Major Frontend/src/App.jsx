@@ -31,7 +31,7 @@ function App() {
   const API_CONFIG = {
     baseUrl:
       import.meta.env.VITE_API_BASE_URL || "https://major-4w34.onrender.com",
-    pollingInterval: 2000, // Poll every 2 seconds
+    pollingInterval: 2000, // Fallback polling when EventSource is unavailable
   };
 
   // Load ElevenLabs ConvAI widget
@@ -266,12 +266,62 @@ function App() {
       // Backend automatically saves to MongoDB when webhook is received
       setDbStatus("success");
       setTimeout(() => setDbStatus("idle"), 3000);
+    } else if (webhookPayload?.registration) {
+      // LiveKit calls: fields arrive one at a time while the patient talks
+      const registration = webhookPayload.registration;
+
+      setPatientData((previous) => ({
+        ...(previous.conversationId === registration.conversationId
+          ? previous
+          : {
+              name: "",
+              age: "",
+              gender: "",
+              contact: "",
+              address: "",
+              reason: "",
+              preferredDoctor: "",
+              medicalHistory: "",
+              emergencyContact: "",
+              appointmentPreference: "",
+            }),
+        ...registration,
+        timestamp: new Date().toISOString(),
+      }));
+      setIsConnected(true);
     }
   }, []);
 
-  // Real-time webhook polling
+  // Real-time webhook updates: Server-Sent Events, with polling as a fallback
   useEffect(() => {
-    let intervalId;
+    if (!isPolling) {
+      return undefined;
+    }
+
+    let lastTimestamp = lastUpdate;
+    const applyUpdate = (data) => {
+      if (data && data.timestamp && data.timestamp !== lastTimestamp) {
+        lastTimestamp = data.timestamp;
+        handleWebhookData(data);
+        setLastUpdate(data.timestamp);
+      }
+    };
+
+    if (typeof EventSource !== "undefined") {
+      // The browser reconnects automatically and the server replays the latest snapshot
+      const source = new EventSource(`${API_CONFIG.baseUrl}/api/events`);
+      source.addEventListener("webhook", (event) => {
+        try {
+          applyUpdate(JSON.parse(event.data));
+        } catch (error) {
+          console.error("Event stream parse error:", error);
+        }
+      });
+      source.onerror = (error) => {
+        console.error("Event stream error:", error);
+      };
+      return () => source.close();
+    }
 
     const pollWebhookData = async () => {
       try {
@@ -279,28 +329,17 @@ function App() {
           `${API_CONFIG.baseUrl}/api/get-latest-webhook`
         );
         if (response.ok) {
-          const data = await response.json();
-          if (data && data.timestamp !== lastUpdate) {
-            handleWebhookData(data);
-            setLastUpdate(data.timestamp);
-          }
+          applyUpdate(await response.json());
         }
       } catch (error) {
         console.error("Polling error:", error);
       }
     };
 
-    if (isPolling) {
-      intervalId = setInterval(pollWebhookData, API_CONFIG.pollingInterval);
-    }
-
-    return () => {
-      if (intervalId) {
-        clearInterval(intervalId);
-      }
-    };
+    const intervalId = setInterval(pollWebhookData, API_CONFIG.pollingInterval);
+    return () => clearInterval(intervalId);
     // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [isPolling, lastUpdate, handleWebhookData]);
+  }, [isPolling, handleWebhookData]);
 
   // Toggle real-time polling
   const togglePolling = () => {
@@ -308,85 +347,16 @@ function App() {
   };
 
   // Download all patients data from database
-  const downloadPatientsData = async () => {
+  // The backend streams the CSV, so the browser saves it straight to disk
+  // without loading every record into memory first
+  const downloadPatientsData = () => {
     try {
       setDbStatus("loading");
-      const response = await fetch(
-        `${API_CONFIG.baseUrl}/api/patients?limit=1000`
-      );
-
-      if (!response.ok) {
-        throw new Error(
-          `Failed to fetch patient data: ${response.status} ${response.statusText}`
-        );
-      }
-
-      const data = await response.json();
-      console.log("Download response:", data);
-
-      // Backend returns { status: "success", patients: [...], count: X }
-      const patients = data.patients || [];
-
-      if (!patients || patients.length === 0) {
-        alert(
-          "No patient data available to download. Please ensure:\n1. Backend is running\n2. Database is connected\n3. At least one patient registration is completed"
-        );
-        setDbStatus("idle");
-        return;
-      }
-
-      // Convert to CSV format
-      const headers = [
-        "Name",
-        "Age",
-        "Gender",
-        "Contact",
-        "Address",
-        "Reason for Visit",
-        "Preferred Doctor",
-        "Medical History",
-        "Emergency Contact",
-        "Appointment Preference",
-        "Conversation ID",
-        "Call Duration (secs)",
-        "Source",
-        "Created At",
-        "Status",
-      ];
-
-      const csvRows = [];
-      csvRows.push(headers.join(","));
-
-      patients.forEach((patient) => {
-        const row = [
-          patient.name || "",
-          patient.age || "",
-          patient.gender || "",
-          patient.contact || "",
-          patient.address || "",
-          patient.reason || "",
-          patient.preferredDoctor || "",
-          patient.medicalHistory || "",
-          patient.emergencyContact || "",
-          patient.appointmentPreference || "",
-          patient.conversationId || "",
-          patient.callDuration || "",
-          patient.source || "elevenlabs",
-          patient.createdAt ? new Date(patient.createdAt).toLocaleString() : "",
-          patient.status || "completed",
-        ].map((field) => `"${String(field).replace(/"/g, '""')}"`); // Escape quotes
-
-        csvRows.push(row.join(","));
-      });
-
-      const csvContent = csvRows.join("\n");
-
-      // Create blob and download
-      const blob = new Blob([csvContent], { type: "text/csv;charset=utf-8;" });
       const link = document.createElement("a");
-      const url = URL.createObjectURL(blob);
-
-      link.setAttribute("href", url);
+      link.setAttribute(
+        "href",
+        `${API_CONFIG.baseUrl}/api/patients/export?format=csv`
+      );
       link.setAttribute(
         "download",
         `VocaCare_Patients_${new Date().toISOString().split("T")[0]}.csv`
@@ -397,7 +367,6 @@ function App() {
       link.click();
       document.body.removeChild(link);
 
-      alert(`Successfully downloaded ${patients.length} patient record(s)!`);
       setDbStatus("success");
       setTimeout(() => setDbStatus("idle"), 2000);
     } catch (error) {
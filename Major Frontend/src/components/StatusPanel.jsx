@@ -90,7 +90,7 @@ const StatusPanel = ({
             {conversationData ? (
               <>
                 <p>Duration: {patientInfo.callDuration || 0}s</p>
-                <p>Turns: {conversationData.transcript?.length || 0}</p>
+                <p>Turns: {conversationData.transcript_turns ?? conversationData.transcript?.length ?? 0}</p>
               </>
             ) : (
               <p className="text-gray-400">No active call</p>
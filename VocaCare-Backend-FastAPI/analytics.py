@@ -0,0 +1,189 @@
+"""
+Pre-aggregated analytics rollups
+Every saved registration increments hourly and daily rollup documents in
+analytics_rollups ($inc upserts, one per bucket per batch), so dashboards
+read a handful of small documents instead of aggregating the raw collection.
+
+Recompute all rollups from patient_registrations (pause ingest while this runs):
+
+    python analytics.py --rebuild
+"""
+
+import asyncio
+import logging
+import re
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from pymongo import UpdateOne
+
+GRANULARITIES = ("hour", "day")
+
+logger = logging.getLogger(__name__)
+
+# Call duration histogram buckets in seconds: label -> upper bound (exclusive)
+DURATION_BUCKETS = [
+    ("0-30s", 30),
+    ("30-60s", 60),
+    ("1-2m", 120),
+    ("2-5m", 300),
+    ("5-10m", 600),
+    ("10-20m", 1200),
+    ("20m+", float("inf")),
+]
+
+_UNSAFE_KEY = re.compile(r"[.$\s]+")
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_key(value) -> Optional[str]:
+    """Normalise free text into a field-name-safe counter key"""
+    text = str(value or "").strip().lower()
+    if not text:
+        return None
+    return _UNSAFE_KEY.sub(" ", text).strip().replace(" ", "_")[:64] or None
+
+
+def duration_bucket(seconds) -> Optional[str]:
+    if not isinstance(seconds, (int, float)) or seconds < 0:
+        return None
+    for label, upper in DURATION_BUCKETS:
+        if seconds < upper:
+            return label
+    return None
+
+
+def rollup_increments(records: list) -> Dict[tuple, Counter]:
+    """Fold a batch of registrations into {(granularity, bucketStart): $inc}"""
+    increments: Dict[tuple, Counter] = defaultdict(Counter)
+    for record in records:
+        created_at = record.get("createdAt")
+        if not isinstance(created_at, datetime):
+            continue
+        reason = rollup_key(record.get("reason"))
+        doctor = rollup_key(record.get("preferredDoctor"))
+        duration = record.get("callDuration")
+        bucket = duration_bucket(duration)
+        for granularity in GRANULARITIES:
+            inc = increments[(granularity, bucket_start(created_at, granularity))]
+            inc["calls"] += 1
+            if reason:
+                inc[f"reasons.{reason}"] += 1
+            if doctor:
+                inc[f"doctors.{doctor}"] += 1
+            if bucket:
+                inc[f"durations.{bucket}"] += 1
+                inc["durationTotalSecs"] += duration
+                inc["durationCount"] += 1
+    return increments
+
+
+class Analytics:
+    """Maintains and queries the rollup documents"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._pending: Set[asyncio.Task] = set()
+
+    def record(self, records: list):
+        """BatchWriter listener: apply the batch's increments in the background"""
+        task = asyncio.create_task(self.apply(records))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def apply(self, records: list):
+        operations = [
+            UpdateOne(
+                {"_id": f"{granularity}:{start.isoformat()}"},
+                {
+                    "$inc": dict(inc),
+                    "$setOnInsert": {"granularity": granularity, "bucketStart": start},
+                },
+                upsert=True,
+            )
+            for (granularity, start), inc in rollup_increments(records).items()
+        ]
+        if not operations:
+            return
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.warning(f"⚠️ Analytics rollup update failed: {e}")
+
+    async def drain(self):
+        """Wait for in-flight rollup updates (used on shutdown)"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    async def buckets(self, granularity: str, start: Optional[datetime], end: Optional[datetime]) -> list:
+        query: dict = {"granularity": granularity}
+        window = {}
+        if start:
+            window["$gte"] = bucket_start(start, granularity)
+        if end:
+            window["$lt"] = end
+        if window:
+            query["bucketStart"] = window
+        return await self.collection.find(query).sort("bucketStart", 1).to_list(length=None)
+
+    async def volume(self, granularity, start, end) -> list:
+        return [
+            {"bucket": doc["bucketStart"], "calls": doc.get("calls", 0)}
+            for doc in await self.buckets(granularity, start, end)
+        ]
+
+    async def top(self, field: str, start, end, limit: int) -> list:
+        """Most frequent keys of a counter map ("reasons" or "doctors")"""
+        totals: Counter = Counter()
+        for doc in await self.buckets("day", start, end):
+            totals.update(doc.get(field, {}))
+        return [{"key": key, "count": count} for key, count in totals.most_common(limit)]
+
+    async def durations(self, start, end) -> dict:
+        histogram: Counter = Counter()
+        total_secs = count = 0
+        for doc in await self.buckets("day", start, end):
+            histogram.update(doc.get("durations", {}))
+            total_secs += doc.get("durationTotalSecs", 0)
+            count += doc.get("durationCount", 0)
+        return {
+            "histogram": [
+                {"bucket": label, "count": histogram.get(label, 0)} for label, _ in DURATION_BUCKETS
+            ],
+            "calls": count,
+            "average_secs": round(total_secs / count, 1) if count else None,
+        }
+
+    async def rebuild(self, registrations, batch_size: int = 1000) -> int:
+        """Recompute every rollup from the raw registrations"""
+        await self.collection.delete_many({})
+        projection = {"createdAt": 1, "reason": 1, "preferredDoctor": 1, "callDuration": 1, "_id": 0}
+        batch, processed = [], 0
+        async for record in registrations.find({}, projection).batch_size(batch_size):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await self.apply(batch)
+                processed += len(batch)
+                batch = []
+                print(f"📊 Rolled up {processed} registration(s)...")
+        if batch:
+            await self.apply(batch)
+            processed += len(batch)
+        return processed
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv:
+        from database import analytics_rollups, patient_registrations
+
+        total = asyncio.run(Analytics(analytics_rollups).rebuild(patient_registrations))
+        print(f"✅ Rebuilt analytics from {total} registration(s)")
+    else:
+        print(__doc__)
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark for LiveKit token minting
+Compares a fresh livekit.api.AccessToken per request (the previous
+/api/livekit-token code path) with livekit_tokens.TokenService, on one core.
+Run: python bench_livekit_tokens.py
+"""
+
+import time
+
+from livekit_tokens import TokenService, new_room_name
+
+try:
+    from livekit import api
+except ImportError:  # optional: only needed for the comparison
+    api = None
+
+API_KEY = "bench_key"
+API_SECRET = "bench_secret_" + "x" * 32
+DURATION_SECS = 2.0
+
+
+def sdk_mint(participant_name="Patient"):
+    token = api.AccessToken(API_KEY, API_SECRET)
+    token.with_identity(participant_name)
+    token.with_name(participant_name)
+    token.with_grants(api.VideoGrants(
+        room_join=True,
+        room=f"vocare_room_{int(time.time())}",
+        can_publish=True,
+        can_subscribe=True,
+    ))
+    return token.to_jwt()
+
+
+def tokens_per_sec(label, func, per_call=1):
+    # process_time so the figure is per core, independent of other load
+    minted = 0
+    start = time.process_time()
+    while time.process_time() - start < DURATION_SECS:
+        for _ in range(100):
+            func()
+        minted += 100
+    rate = minted * per_call / (time.process_time() - start)
+    print(f"   {label:<32} {rate:12,.0f} tokens/sec/core")
+    return rate
+
+
+def main():
+    service = TokenService("wss://bench.livekit.cloud", API_KEY, API_SECRET)
+
+    print("=" * 60)
+    print("⏱️  LiveKit token minting (single core)")
+    print("=" * 60)
+    if api is not None:
+        token = service.mint("Patient")["token"]
+        claims = api.TokenVerifier(API_KEY, API_SECRET).verify(token)
+        assert claims.video.room_join and claims.identity == "Patient", "claims differ from the SDK"
+        old = tokens_per_sec("AccessToken per request", sdk_mint)
+    else:
+        print("   (pip install livekit-api to compare with the SDK)")
+        old = None
+    new = tokens_per_sec("TokenService.mint", lambda: service.mint("Patient"))
+    if old:
+        print(f"   🚀 speed-up: {new / old:.2f}x")
+
+    names = {new_room_name() for _ in range(100000)}
+    print(f"\n   🏷️  {len(names):,} unique room names out of 100,000 generated")
+    tokens_per_sec("TokenService.mint_batch(100)", lambda: service.mint_batch(100), per_call=100)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark for webhook ingest and patient list serialization
+Compares the previous hand-written code paths with schema.build_patient_record
+(a parity check: the gain comes from orjson parsing) and
+responses.ORJSONResponse. Run: python bench_serialization.py
+"""
+
+import copy
+import json
+import timeit
+from datetime import datetime
+
+import orjson
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from responses import ORJSONResponse
+from schema import build_patient_record
+from send_test_webhook import sample_webhook
+
+PAGE_SIZE = 50
+
+
+def legacy_build_patient_record(payload):
+    """The chained .get() mapping previously inlined in receive_webhook"""
+    if payload.get('data', {}).get('analysis', {}).get('data_collection_results'):
+        results = payload['data']['analysis']['data_collection_results']
+        return {
+            "name": results.get('Name', {}).get('value', ''),
+            "age": results.get('Age', {}).get('value', ''),
+            "gender": results.get('Gender', {}).get('value', ''),
+            "contact": results.get('Contact', {}).get('value', ''),
+            "address": results.get('Address ', {}).get('value', ''),
+            "reason": results.get('Reason', {}).get('value', ''),
+            "preferredDoctor": results.get('Preferred Doctor', {}).get('value', ''),
+            "medicalHistory": results.get('Previous Medical History', {}).get('value', ''),
+            "emergencyContact": results.get('Emergency Contact', {}).get('value', ''),
+            "appointmentPreference": results.get('Appointment Preference', {}).get('value', ''),
+            "conversationId": payload['data'].get('conversation_id'),
+            "transcript": payload['data'].get('transcript', []),
+            "transcriptSummary": payload['data'].get('analysis', {}).get('transcript_summary', ''),
+            "callDuration": payload['data'].get('metadata', {}).get('call_duration_secs'),
+            "createdAt": datetime.now(),
+            "status": "completed"
+        }
+    return None
+
+
+def sample_page():
+    """A page of documents shaped like Motor returns them"""
+    page = []
+    for i in range(PAGE_SIZE):
+        record = build_patient_record(sample_webhook)
+        record["_id"] = ObjectId()
+        record["conversationId"] = f"bench_{i}"
+        page.append(record)
+    return page
+
+
+def legacy_render(page):
+    patients = copy.copy(page)
+    for i, patient in enumerate(patients):
+        patients[i] = {**patient, "_id": str(patient["_id"])}  # Convert ObjectId to string
+    content = {"status": "success", "count": len(patients), "patients": patients}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def orjson_render(page):
+    content = {"status": "success", "count": len(page), "patients": page}
+    return ORJSONResponse(content).body
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    per_call_us = seconds / number * 1e6
+    print(f"   {label:<28} {per_call_us:10.2f} µs/call")
+    return per_call_us
+
+
+def main():
+    assert {k: v for k, v in build_patient_record(sample_webhook).items() if k != "createdAt"} == {
+        k: v for k, v in legacy_build_patient_record(sample_webhook).items() if k != "createdAt"
+    }, "extractor output differs from the legacy mapping"
+
+    body = json.dumps(sample_webhook).encode()
+    print("=" * 60)
+    print(f"⏱️  Webhook ingest: {len(body)}-byte body -> patient record")
+    print("=" * 60)
+    old = bench("legacy chained .get()", lambda: legacy_build_patient_record(sample_webhook), 20000)
+    new = bench("field-map extractor", lambda: build_patient_record(sample_webhook), 20000)
+    # Same work, declared once in schema.py; not expected to be faster
+    print(f"   ⚖️  ratio: {old / new:.2f}x")
+    old = bench("json.loads + legacy", lambda: legacy_build_patient_record(json.loads(body)), 20000)
+    new = bench("orjson.loads + field map", lambda: build_patient_record(orjson.loads(body)), 20000)
+    print(f"   🚀 speed-up: {old / new:.2f}x")
+
+    page = sample_page()
+    print("\n" + "=" * 60)
+    print(f"⏱️  /api/patients: {PAGE_SIZE} documents -> JSON bytes")
+    print("=" * 60)
+    old = bench("_id loop + jsonable_encoder", lambda: legacy_render(page), 200)
+    new = bench("ORJSONResponse", lambda: orjson_render(page), 200)
+    print(f"   🚀 speed-up: {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Registrations for calls that are still in progress
+The LiveKit agent posts its transcript to /webhook/livekit in numbered chunks
+while the call runs. Each chunk is compressed into patient_transcripts and
+the call's registration is upserted (status "in_progress") with the running
+turn count and search keywords. Registration fields confirmed by the agent's
+tools are set on the same document as they arrive, and the final chunk marks
+it "completed".
+"""
+
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from pagination import DEFAULT_PROJECTION
+from schema import PATIENT_FIELD_MAP
+from search import transcript_keywords
+from transcripts import TranscriptStore
+
+
+class CallSessions:
+    """Apply LiveKit transcript chunks to patient_registrations"""
+
+    def __init__(self, registrations, transcript_store: TranscriptStore, transcript_writer,
+                 on_complete: Optional[Callable[[list], None]] = None,
+                 on_insert: Optional[Callable[[list], None]] = None):
+        self.registrations = registrations
+        self.transcript_store = transcript_store
+        self.transcript_writer = transcript_writer
+        # Called with [registration] when a call completes (BatchWriter.notify)
+        self.on_complete = on_complete
+        # Called with [registration] when a call's first update creates it (counters)
+        self.on_insert = on_insert
+
+    def _in_progress(self) -> dict:
+        return {"source": "livekit", "status": "in_progress", "createdAt": datetime.now()}
+
+    def _inserted(self, conversation_id: str, upserted_id):
+        if upserted_id is not None and self.on_insert:
+            self.on_insert([{"_id": upserted_id, "conversationId": conversation_id}])
+
+    async def _upsert(self, conversation_id: str, update: dict) -> dict:
+        # The first transcript chunk and the first field of a call can race to
+        # insert the registration; the loser retries as a plain update
+        for attempt in range(2):
+            try:
+                result = await self.registrations.update_one({"conversationId": conversation_id}, update, upsert=True)
+                break
+            except DuplicateKeyError:
+                if attempt:
+                    raise
+        self._inserted(conversation_id, result.upserted_id)
+        return await self.registrations.find_one({"conversationId": conversation_id}, DEFAULT_PROJECTION)
+
+    async def update_fields(self, conversation_id: str, fields: dict) -> dict:
+        """Set confirmed registration fields; returns the registration so far"""
+        unknown = set(fields) - set(PATIENT_FIELD_MAP)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        values = {field: str(value).strip() for field, value in fields.items()}
+        return await self._upsert(
+            conversation_id,
+            {
+                "$setOnInsert": self._in_progress(),
+                "$set": {**values, "updatedAt": datetime.now()},
+            },
+        )
+
+    async def append_transcript(self, conversation_id: str, seq: int, turns: List[dict]) -> bool:
+        """
+        Store one chunk and advance the registration
+        Chunks must arrive in seq order; a chunk at or below the last applied
+        seq (an agent retry) is ignored and False is returned. The chunk is
+        only queued for patient_transcripts once its seq has been accepted,
+        and the seq is rewound if queueing fails so the agent's retry applies.
+        """
+        chunk = await self.transcript_store.encode(conversation_id, turns, seq) if turns else None
+        ref = {
+            "collection": "patient_transcripts",
+            "codec": self.transcript_store.codec,
+            "lastSeq": seq,
+        }
+        keywords = transcript_keywords(turns)
+        update = {
+            "$set": {
+                **{f"transcriptRef.{key}": value for key, value in ref.items()},
+                "updatedAt": datetime.now(),
+            },
+            "$inc": {"transcriptRef.turns": len(turns)},
+        }
+        if keywords:
+            update["$addToSet"] = {"transcriptKeywords": {"$each": keywords}}
+
+        # Never upserted: with a stale seq the filter does not match and an
+        # upsert would insert a second registration wherever the unique
+        # conversationId index is missing
+        applied, previous = await self._advance(conversation_id, seq, update)
+        if not applied:
+            # Only inserts: a registration that exists is left alone
+            try:
+                result = await self.registrations.update_one(
+                    {"conversationId": conversation_id},
+                    {"$setOnInsert": {
+                        **self._in_progress(),
+                        "transcriptRef": {**ref, "turns": len(turns)},
+                        "transcriptKeywords": keywords,
+                        "updatedAt": datetime.now(),
+                    }},
+                    upsert=True,
+                )
+                applied = result.upserted_id is not None
+                self._inserted(conversation_id, result.upserted_id)
+            except DuplicateKeyError:
+                applied = False
+            if not applied:
+                # Created meanwhile, e.g. by update_fields without a transcript yet
+                applied, previous = await self._advance(conversation_id, seq, update)
+        if not applied:
+            return False
+        if chunk:
+            try:
+                await self.transcript_writer.put(chunk)
+            except Exception:
+                await self._rewind(conversation_id, seq, previous, len(turns))
+                raise
+        return True
+
+    async def _advance(self, conversation_id: str, seq: int, update: dict) -> Tuple[bool, Optional[int]]:
+        """Apply `update` if `seq` is past lastSeq: (applied, the lastSeq it replaced)"""
+        before = await self.registrations.find_one_and_update(
+            {"conversationId": conversation_id, "transcriptRef.lastSeq": {"$not": {"$gte": seq}}},
+            update,
+            projection={"transcriptRef.lastSeq": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            return False, None
+        return True, (before.get("transcriptRef") or {}).get("lastSeq")
+
+    async def _rewind(self, conversation_id: str, seq: int, previous: Optional[int], turns: int):
+        """Undo the lastSeq advance of a chunk that could not be queued"""
+        rewind = {"$inc": {"transcriptRef.turns": -turns}}
+        if previous is None:
+            rewind["$unset"] = {"transcriptRef.lastSeq": ""}
+        else:
+            rewind["$set"] = {"transcriptRef.lastSeq": previous}
+        await self.registrations.update_one({"conversationId": conversation_id, "transcriptRef.lastSeq": seq}, rewind)
+
+    async def complete(self, conversation_id: str, call_duration: Optional[float] = None) -> Optional[dict]:
+        """Mark the call finished and hand the registration to on_complete"""
+        fields = {"status": "completed", "updatedAt": datetime.now()}
+        if call_duration is not None:
+            fields["callDuration"] = call_duration
+        record = await self.registrations.find_one_and_update(
+            {"conversationId": conversation_id, "status": {"$ne": "completed"}},
+            {"$set": fields},
+            return_document=ReturnDocument.AFTER,
+        )
+        if record and self.on_complete:
+            self.on_complete([record])
+        return record
@@ -0,0 +1,176 @@
+"""
+Negotiated response compression
+Responses of at least COMPRESSION_MIN_BYTES are compressed with the
+encoding the client prefers among those available: zstd (`pip install
+zstandard`), br (`pip install brotli`) and gzip. With equal q-values zstd
+wins, then br, then gzip. Streaming responses (exports) are compressed
+chunk by chunk; Server-Sent Events and responses that already carry a
+Content-Encoding are passed through untouched.
+"""
+
+import asyncio
+import zlib
+from typing import Callable, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Single responses larger than this are compressed in a worker thread
+OFFLOAD_BYTES = 64 * 1024
+
+# Content types that must reach the client unbuffered
+PASSTHROUGH_TYPES = ("text/event-stream",)
+
+
+class _Compressor:
+    """Incremental compressor: compress() chunks, then finish()"""
+
+    def __init__(self, compress: Callable[[bytes], bytes], finish: Callable[[], bytes]):
+        self.compress = compress
+        self.finish = finish
+
+
+def _gzip() -> _Compressor:
+    stream = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return _Compressor(stream.compress, stream.flush)
+
+
+def _brotli() -> _Compressor:
+    stream = brotli.Compressor(quality=5)
+    return _Compressor(stream.process, stream.finish)
+
+
+def _zstd() -> _Compressor:
+    stream = zstandard.ZstdCompressor(level=3).compressobj()
+    return _Compressor(stream.compress, stream.flush)
+
+
+def available_encodings() -> Dict[str, Callable[[], _Compressor]]:
+    """Content-Encoding name -> compressor factory, in server preference order"""
+    encodings = {}
+    if zstandard is not None:
+        encodings["zstd"] = _zstd
+    if brotli is not None:
+        encodings["br"] = _brotli
+    encodings["gzip"] = _gzip
+    return encodings
+
+
+def negotiate(accept_encoding: str, encodings) -> Optional[str]:
+    """Best of `encodings` (in preference order) for an Accept-Encoding header"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for name in encodings:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionMiddleware:
+    """Plain ASGI middleware compressing HTTP responses per Accept-Encoding"""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(send, encoding, self.encodings[encoding], self.minimum_size))
+
+
+class _Responder:
+    """send() wrapper deciding on the first body message whether to compress"""
+
+    def __init__(self, send, encoding: str, factory: Callable[[], _Compressor], minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.factory = factory
+        self.minimum_size = minimum_size
+        self.start = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            # Held until the first body chunk shows how large the response is
+            self.start = message
+            headers = Headers(raw=message.get("headers", []))
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or content_type.startswith(PASSTHROUGH_TYPES)
+                or message["status"] in (204, 304)
+            )
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start.setdefault("headers", []))
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.compressor = self.factory()
+            headers["Content-Encoding"] = self.encoding
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = await self._compress_all(body)
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self.send(self.start)
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _compress_all(self, body: bytes) -> bytes:
+        compressor = self.compressor
+
+        def compress() -> bytes:
+            return compressor.compress(body) + compressor.finish()
+
+        if len(body) > OFFLOAD_BYTES:
+            return await asyncio.to_thread(compress)
+        return compress()
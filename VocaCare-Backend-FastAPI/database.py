@@ -1,8 +1,277 @@
+"""
+MongoDB connection
+The Motor client is created by the app's lifespan (connect/close) with pool
+sizes and timeouts from the MONGO_* settings, and warmed up with a ping. A
+circuit breaker opens after consecutive connection failures, so requests fail
+fast with DatabaseUnavailable while MongoDB is unreachable instead of each
+waiting out server selection; a background probe pings until it answers.
+
+The collections below can be imported anywhere: they resolve against the
+current client, and scripts that never call connect() get one on first use.
+"""
+
+import asyncio
+import contextlib
+import logging
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Awaitable, Callable, Optional
+
 from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ConnectionFailure, WaitQueueTimeoutError
+
+from metrics import mongo_listener
+
 load_dotenv()
 
-client = AsyncIOMotorClient(os.getenv("MONGO_DB_URI"))
-db = client.get_database("medical_records")
-patient_registrations = db.get_collection("patient_registrations")
+DATABASE_NAME = "medical_records"
+
+# Collection methods that talk to the server and are guarded by the breaker
+GUARDED_METHODS = frozenset({
+    "insert_one", "insert_many", "find_one", "find_one_and_update", "update_one",
+    "update_many", "delete_many", "bulk_write", "count_documents",
+    "estimated_document_count", "create_index", "create_indexes", "index_information",
+})
+# Methods returning cursors, and the cursor methods that chain
+CURSOR_METHODS = frozenset({"find", "aggregate", "list_indexes"})
+CHAINED_METHODS = frozenset({"sort", "skip", "limit", "batch_size", "hint", "max_time_ms"})
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(ConnectionFailure):
+    """The circuit is open: MongoDB is known to be unreachable"""
+
+
+class CircuitBreaker:
+    """Open after `failure_threshold` consecutive connection failures; probe until recovered"""
+
+    def __init__(self, probe: Callable[[], Awaitable], failure_threshold: int = 3,
+                 probe_interval: float = 5.0):
+        self._probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = "closed"
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.opened = 0
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def check(self):
+        if self.state == "open":
+            raise DatabaseUnavailable(f"MongoDB unavailable (circuit open): {self.last_error}")
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error)
+        if self.failures >= self.failure_threshold:
+            self.trip(error)
+
+    def trip(self, error: Exception):
+        """Open the circuit now and start probing"""
+        self.last_error = str(error)
+        if self.state == "open":
+            return
+        self.state = "open"
+        self.opened += 1
+        logger.warning(f"⚠️ MongoDB circuit open, failing fast until it recovers: {error}")
+        self._probe_task = asyncio.create_task(self._probe_until_recovered())
+
+    async def _probe_until_recovered(self):
+        while self.state == "open":
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await self._probe()
+            except Exception as e:
+                self.last_error = str(e)
+                continue
+            self.state = "closed"
+            self.failures = 0
+            logger.info("✅ MongoDB reachable again, circuit closed")
+
+    def stop(self):
+        if self._probe_task:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+
+class Mongo:
+    """Owns the Motor client and its circuit breaker"""
+
+    def __init__(self, uri: Optional[str] = None):
+        self.uri = uri
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.warm = False
+        self.breaker = CircuitBreaker(
+            self.ping,
+            failure_threshold=int(os.getenv("MONGO_BREAKER_THRESHOLD", "3")),
+            probe_interval=float(os.getenv("MONGO_PROBE_INTERVAL_SECS", "5")),
+        )
+
+    @staticmethod
+    def client_options() -> dict:
+        return {
+            "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+            "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+            "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+            "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+            "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+            "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000")),
+            "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        }
+
+    def connect(self) -> AsyncIOMotorClient:
+        if self.client is None:
+            # mongo_listener times every command for /metrics
+            self.client = AsyncIOMotorClient(
+                self.uri or os.getenv("MONGO_DB_URI"),
+                event_listeners=[mongo_listener],
+                **self.client_options(),
+            )
+        return self.client
+
+    @property
+    def db(self):
+        return self.connect().get_database(DATABASE_NAME)
+
+    @property
+    def ready(self) -> bool:
+        """Warmed up and not failing: safe to route traffic here"""
+        return self.client is not None and self.warm and self.breaker.state == "closed"
+
+    async def ping(self):
+        await self.db.command("ping")
+        self.warm = True
+
+    async def warm_up(self):
+        """
+        First round trip: selects a server and opens pooled connections
+        Connection failures open the circuit, whose probe pings until MongoDB
+        answers; other errors (authentication, configuration) are retried
+        here with backoff, so readiness recovers once they are fixed.
+        """
+        delay = self.breaker.probe_interval
+        while True:
+            try:
+                await self.ping()
+                logger.info("✅ Connected to MongoDB")
+                return
+            except ConnectionFailure as e:
+                self.breaker.trip(e)
+                return
+            except Exception as e:
+                self.breaker.last_error = str(e)
+                logger.warning(f"⚠️ MongoDB warm-up failed, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    def close(self):
+        self.breaker.stop()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        self.warm = False
+
+    def guard(self, method):
+        """Wrap a collection coroutine method with the breaker"""
+        breaker = self.breaker
+
+        async def guarded(*args, **kwargs):
+            breaker.check()
+            with self.recording():
+                return await method(*args, **kwargs)
+
+        return guarded
+
+    @contextlib.contextmanager
+    def recording(self):
+        """Count connection failures (not pool exhaustion under load) towards the breaker"""
+        try:
+            yield
+        except WaitQueueTimeoutError:
+            raise
+        except ConnectionFailure as e:
+            if not isinstance(e, DatabaseUnavailable):
+                self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        # Any successful round trip shows the client works
+        self.warm = True
+
+    def collection(self, name: str) -> "CollectionHandle":
+        return CollectionHandle(self, name)
+
+
+class CollectionHandle:
+    """A collection of the current client, with server calls going through the breaker"""
+
+    def __init__(self, mongo: Mongo, name: str):
+        self._mongo = mongo
+        self.name = name
+        self._client = None
+        self._collection = None
+
+    def _resolve(self):
+        client = self._mongo.connect()
+        if client is not self._client:
+            self._client = client
+            self._collection = self._mongo.db.get_collection(self.name)
+        return self._collection
+
+    def __getattr__(self, attr):
+        target = getattr(self._resolve(), attr)
+        if attr in GUARDED_METHODS:
+            return self._mongo.guard(target)
+        if attr in CURSOR_METHODS:
+            def open_cursor(*args, **kwargs):
+                self._mongo.breaker.check()
+                return GuardedCursor(self._mongo, target(*args, **kwargs))
+            return open_cursor
+        return target
+
+
+class GuardedCursor:
+    """Cursor whose round trips count towards the breaker"""
+
+    def __init__(self, mongo: Mongo, cursor):
+        self._mongo = mongo
+        self._cursor = cursor
+
+    def __getattr__(self, attr):
+        target = getattr(self._cursor, attr)
+        if attr == "to_list":
+            return self._mongo.guard(target)
+        if attr in CHAINED_METHODS:
+            def chain(*args, **kwargs):
+                target(*args, **kwargs)
+                return self
+            return chain
+        return target
+
+    async def __aiter__(self):
+        with self._mongo.recording():
+            async for document in self._cursor:
+                yield document
+
+
+class DatabaseHandle:
+    """The medical_records database of the current client"""
+
+    def __init__(self, mongo: Mongo):
+        self._mongo = mongo
+
+    def get_collection(self, name: str) -> CollectionHandle:
+        return self._mongo.collection(name)
+
+    def __getattr__(self, attr):
+        return getattr(self._mongo.db, attr)
+
+
+mongo = Mongo()
+db = DatabaseHandle(mongo)
+patient_registrations = mongo.collection("patient_registrations")
+patient_transcripts = mongo.collection("patient_transcripts")
+analytics_rollups = mongo.collection("analytics_rollups")
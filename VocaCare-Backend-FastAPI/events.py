@@ -0,0 +1,134 @@
+"""
+Real-time event fan-out for dashboards
+Webhook handlers record events in the log and publish them here;
+SSE, WebSocket and long-poll clients receive them
+"""
+
+import asyncio
+import itertools
+import json
+from collections import deque
+from typing import List, Optional, Set
+
+
+class SlowConsumer(Exception):
+    """Raised to a subscriber whose queue overflowed and was dropped"""
+
+
+_DROPPED = object()
+
+
+class Subscription:
+    """A single dashboard connection with its own bounded queue"""
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """Wait for the next event; returns None when a heartbeat is due"""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is _DROPPED:
+            raise SlowConsumer()
+        return event
+
+
+class EventBroker:
+    """In-process publish/subscribe hub with slow-consumer dropping"""
+
+    def __init__(self, queue_size: int = 32):
+        self.queue_size = queue_size
+        self.dropped_total = 0
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, event: dict):
+        """Push an event to every subscriber without ever awaiting"""
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription: Subscription):
+        # The client is not keeping up; free its backlog and wake it so it
+        # can close. EventSource/WebSocket clients reconnect and resync.
+        self._subscribers.discard(subscription)
+        subscription.dropped = True
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(_DROPPED)
+        self.dropped_total += 1
+
+
+class WebhookLog:
+    """Bounded ring buffer of recent webhook events with sequence numbers"""
+
+    def __init__(self, capacity: int = 256):
+        self._events: deque = deque(maxlen=capacity)
+        self.last_seq = 0
+        self._changed = asyncio.Event()
+
+    def append(self, event: dict) -> dict:
+        """Stamp the event with the next sequence number and wake waiters"""
+        self.last_seq += 1
+        entry = {"seq": self.last_seq, **event}
+        self._events.append(entry)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+        return entry
+
+    @property
+    def latest(self) -> Optional[dict]:
+        return self._events[-1] if self._events else None
+
+    def since(self, seq: int) -> dict:
+        """
+        Every retained event after the cursor
+        `truncated` means older events were evicted and the client should
+        resync from the database; `reset` means the cursor is from before a
+        server restart and the whole buffer is returned
+        """
+        reset = seq > self.last_seq
+        if reset:
+            seq = 0
+        first_seq = self._events[0]["seq"] if self._events else self.last_seq + 1
+        start = max(0, seq - first_seq + 1)
+        events: List[dict] = list(itertools.islice(self._events, start, None))
+        return {
+            "events": events,
+            "cursor": events[-1]["seq"] if events else seq,
+            "truncated": seq < first_seq - 1,
+            "reset": reset,
+        }
+
+    async def wait_since(self, seq: int, timeout: float) -> dict:
+        """Like since(), but hold on up to `timeout` seconds for a new event"""
+        result = self.since(seq)
+        if result["events"] or timeout <= 0:
+            return result
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return result
+        return self.since(seq)
+
+
+def format_sse(data: dict, event: str = "webhook") -> str:
+    """Encode one Server-Sent Events frame, tagged with its sequence number"""
+    frame = f"id: {data['seq']}\n" if "seq" in data else ""
+    return f"{frame}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,97 @@
+"""
+Streaming export of patient records
+Rows are encoded straight from the MongoDB cursor, so memory use does not
+grow with the number of registrations exported
+"""
+
+import csv
+import io
+import re
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from responses import dumps
+
+# (CSV header, record field, default) - same columns the dashboard used to build
+EXPORT_COLUMNS = [
+    ("Name", "name", ""),
+    ("Age", "age", ""),
+    ("Gender", "gender", ""),
+    ("Contact", "contact", ""),
+    ("Address", "address", ""),
+    ("Reason for Visit", "reason", ""),
+    ("Preferred Doctor", "preferredDoctor", ""),
+    ("Medical History", "medicalHistory", ""),
+    ("Emergency Contact", "emergencyContact", ""),
+    ("Appointment Preference", "appointmentPreference", ""),
+    ("Conversation ID", "conversationId", ""),
+    ("Call Duration (secs)", "callDuration", ""),
+    ("Source", "source", "elevenlabs"),
+    ("Created At", "createdAt", ""),
+    ("Status", "status", "completed"),
+]
+
+CSV_PROJECTION = {field: 1 for _, field, _ in EXPORT_COLUMNS}
+
+# Flush encoded rows to the client in chunks of roughly this many bytes
+CHUNK_SIZE = 64 * 1024
+
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+_NUMERIC = re.compile(r"^[+-]?[\d\s().]+$")
+
+
+def date_range_filter(start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """MongoDB filter on createdAt for an optional [start, end) window"""
+    created = {}
+    if start:
+        created["$gte"] = start
+    if end:
+        created["$lt"] = end
+    return {"createdAt": created} if created else {}
+
+
+def _csv_cell(value, default):
+    if value is None or value == "":
+        value = default
+    if isinstance(value, datetime):
+        return value.isoformat()
+    text = str(value)
+    # Stop spreadsheets from evaluating cells as formulas, but leave phone
+    # numbers such as "+91 98765 43210" alone
+    if text.startswith(_FORMULA_PREFIXES) and not _NUMERIC.match(text):
+        return "'" + text
+    return text
+
+
+async def iter_csv(cursor) -> AsyncIterator[str]:
+    """Yield a CSV document (header first) in ~CHUNK_SIZE pieces"""
+    buffer = io.StringIO()
+    buffer.write("\ufeff")  # BOM so Excel reads UTF-8 (e.g. Hindi names) correctly
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _, _ in EXPORT_COLUMNS])
+    async for record in cursor:
+        writer.writerow([
+            _csv_cell(record.get(field), default)
+            for _, field, default in EXPORT_COLUMNS
+        ])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def iter_ndjson(cursor) -> AsyncIterator[bytes]:
+    """Yield one JSON document per line in ~CHUNK_SIZE pieces"""
+    lines = []
+    size = 0
+    async for record in cursor:
+        line = dumps(record) + b"\n"
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b"".join(lines)
+            lines.clear()
+            size = 0
+    if lines:
+        yield b"".join(lines)
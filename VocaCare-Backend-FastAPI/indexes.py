@@ -0,0 +1,168 @@
+"""
+Index management for patient_registrations and its companion collections
+Indexes are created at app startup (safe to repeat); run this file directly
+to create them by hand or to check index usage:
+
+    python indexes.py            # create missing indexes
+    python indexes.py --check    # report usage and flag missing indexes
+"""
+
+import asyncio
+import logging
+import sys
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+from pagination import SORT_ORDER
+from search import TEXT_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+INDEXES = [
+    # get_patient_by_id lookups. Documents with a missing/null conversationId
+    # are exempt; equality queries on a non-empty id satisfy the $gt filter,
+    # so the planner can use this partial index
+    IndexModel(
+        [("conversationId", ASCENDING)],
+        name="conversationId_unique",
+        unique=True,
+        partialFilterExpression={"conversationId": {"$gt": ""}},
+    ),
+    # /api/patients keyset pages, export ordering and createdAt range filters
+    IndexModel(
+        [("createdAt", DESCENDING), ("_id", DESCENDING)],
+        name="createdAt_desc_id_desc",
+    ),
+    # /api/patients/search ($text allows one text index per collection)
+    IndexModel(
+        [(field, TEXT) for field in TEXT_WEIGHTS],
+        name="patient_text",
+        weights=TEXT_WEIGHTS,
+        default_language="english",
+    ),
+]
+
+TRANSCRIPT_INDEXES = [
+    # One document per transcript chunk; also makes chunk re-delivery idempotent
+    IndexModel(
+        [("conversationId", ASCENDING), ("seq", ASCENDING)],
+        name="conversationId_seq_unique",
+        unique=True,
+    ),
+]
+
+ANALYTICS_INDEXES = [
+    # /api/analytics/* range reads over hourly/daily buckets
+    IndexModel(
+        [("granularity", ASCENDING), ("bucketStart", ASCENDING)],
+        name="granularity_bucketStart",
+    ),
+]
+
+COLLECTION_INDEXES = {
+    "patient_registrations": INDEXES,
+    "patient_transcripts": TRANSCRIPT_INDEXES,
+    "analytics_rollups": ANALYTICS_INDEXES,
+}
+
+# Representative queries issued by the API, checked against their query plans
+QUERY_SHAPES = [
+    ("get_patient_by_id", {"conversationId": "__probe__"}, None),
+    ("list_patients", {}, SORT_ORDER),
+    ("export_date_range", {"createdAt": {"$gte": datetime(1970, 1, 1)}}, [("createdAt", ASCENDING)]),
+]
+
+
+async def ensure_indexes(collection, models: list = INDEXES) -> list:
+    """Create every index in `models`; existing identical indexes are a no-op"""
+    created = []
+    try:
+        for model in models:
+            try:
+                created += await collection.create_indexes([model])
+            except OperationFailure as e:
+                # e.g. duplicate conversationIds blocking the unique index, or
+                # an index with the same name but different options
+                logger.warning(f"⚠️ Could not create index {model.document['name']}: {e}")
+    except PyMongoError as e:
+        logger.warning(f"⚠️ Index setup skipped, database unavailable: {e}")
+    return created
+
+
+async def ensure_all_indexes(db) -> list:
+    """Create the indexes of every collection the API uses"""
+    created = []
+    for name, models in COLLECTION_INDEXES.items():
+        created += await ensure_indexes(db.get_collection(name), models)
+    return created
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def check_indexes(collection) -> dict:
+    """Report expected vs existing indexes, their usage and any COLLSCAN plans"""
+    existing = await collection.index_information()
+    expected = [model.document["name"] for model in INDEXES]
+
+    usage = {}
+    try:
+        async for stat in collection.aggregate([{"$indexStats": {}}]):
+            usage[stat["name"]] = {
+                "ops": stat["accesses"]["ops"],
+                "since": stat["accesses"]["since"].isoformat(),
+            }
+    except OperationFailure:
+        pass  # $indexStats needs clusterMonitor privileges on some deployments
+
+    plans = {}
+    for name, query, sort in QUERY_SHAPES:
+        cursor = collection.find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = list(_stages(explain["queryPlanner"]["winningPlan"]))
+        plans[name] = {
+            "stages": [stage for stage in stages if stage],
+            "collection_scan": "COLLSCAN" in stages,
+        }
+
+    return {
+        "missing": [name for name in expected if name not in existing],
+        "unexpected": [name for name in existing if name not in expected and name != "_id_"],
+        "usage": usage,
+        "query_plans": plans,
+        "healthy": all(name in existing for name in expected)
+        and not any(plan["collection_scan"] for plan in plans.values()),
+    }
+
+
+async def _main(check: bool):
+    from database import db, patient_registrations
+
+    if not check:
+        created = await ensure_all_indexes(db)
+        print(f"✅ Indexes ensured: {', '.join(created) or 'none'}")
+        return
+
+    report = await check_indexes(patient_registrations)
+    for name in report["missing"]:
+        print(f"❌ Missing index: {name}")
+    for name, stats in report["usage"].items():
+        print(f"📊 {name}: {stats['ops']} ops since {stats['since']}")
+    for name, plan in report["query_plans"].items():
+        marker = "❌" if plan["collection_scan"] else "✅"
+        print(f"{marker} {name}: {' <- '.join(plan['stages'])}")
+    print("✅ Indexes healthy" if report["healthy"] else "⚠️ Index problems found")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(check="--check" in sys.argv))
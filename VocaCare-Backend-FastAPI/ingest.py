@@ -0,0 +1,170 @@
+"""
+Incremental parsing of ElevenLabs webhook bodies
+A post-call webhook carries the whole transcript, which for a long call is
+most of the body. The body is parsed as it arrives: transcript turns are
+handed on a few at a time (see TranscriptStream) and everything else is built
+into a small `payload` dict without the transcript, with
+data.transcript_turns holding the turn count. Bodies over
+WEBHOOK_MAX_BODY_BYTES are rejected.
+
+Streaming needs the `ijson` package (in requirements.txt); without it the
+body is buffered, up to the size limit, and parsed in one go, and a warning
+is logged at startup. Bodies
+declared smaller than WEBHOOK_STREAM_THRESHOLD_BYTES are buffered too: orjson
+parses those faster than the event-by-event path, and they are small anyway.
+"""
+
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+import orjson
+
+try:
+    import ijson
+except ImportError:  # optional dependency
+    ijson = None
+
+JSON_ERRORS = (orjson.JSONDecodeError, ijson.JSONError) if ijson else (orjson.JSONDecodeError,)
+
+TRANSCRIPT_PREFIX = "data.transcript"
+TURN_PREFIX = "data.transcript.item"
+
+
+class WebhookTooLarge(ValueError):
+    """The body exceeds the configured maximum size"""
+
+
+class BufferedParser:
+    """Fallback without ijson: buffer the body and parse it on close()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.payload: Optional[dict] = None
+        self.conversation_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> list:
+        self._chunks.append(chunk)
+        return []
+
+    def close(self) -> list:
+        payload = orjson.loads(b"".join(self._chunks))
+        self._chunks = []
+        if not isinstance(payload, dict):
+            raise ValueError("Webhook body must be a JSON object")
+        data = payload.get("data")
+        turns = []
+        if isinstance(data, dict):
+            turns = data.pop("transcript", None) or []
+            data["transcript_turns"] = len(turns)
+            self.conversation_id = data.get("conversation_id")
+        self.payload = payload
+        return turns
+
+
+class StreamingParser:
+    """
+    Push parser over ijson events
+    Every event outside the transcript feeds one object builder (the payload);
+    each transcript turn gets its own builder and is returned by feed() as
+    soon as it is complete.
+    """
+
+    def __init__(self):
+        self._events = ijson.sendable_list()
+        self._parser = ijson.parse_coro(self._events, use_float=True)
+        self._root = ijson.ObjectBuilder()
+        self._turn = None
+        self._depth = 0
+        self.turns = 0
+        self.payload: Optional[dict] = None
+        self.conversation_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> list:
+        self._parser.send(chunk)
+        return self._drain()
+
+    def close(self) -> list:
+        self._parser.close()
+        turns = self._drain()
+        payload = self._root.value
+        if not isinstance(payload, dict):
+            raise ValueError("Webhook body must be a JSON object")
+        if isinstance(payload.get("data"), dict):
+            payload["data"]["transcript_turns"] = self.turns
+        self.payload = payload
+        return turns
+
+    def _drain(self) -> list:
+        turns = []
+        for prefix, event, value in self._events:
+            if prefix == TURN_PREFIX or prefix.startswith(TURN_PREFIX + "."):
+                if self._turn is None:
+                    self._turn = ijson.ObjectBuilder()
+                self._turn.event(event, value)
+                if event in ("start_map", "start_array"):
+                    self._depth += 1
+                elif event in ("end_map", "end_array"):
+                    self._depth -= 1
+                if self._depth == 0:
+                    turns.append(self._turn.value)
+                    self._turn = None
+            elif prefix != TRANSCRIPT_PREFIX:
+                if prefix == "data.conversation_id" and event == "string":
+                    self.conversation_id = value
+                self._root.event(event, value)
+        del self._events[:]
+        self.turns += len(turns)
+        return turns
+
+
+def streaming_available() -> bool:
+    return ijson is not None
+
+
+def create_parser(expected_size: Optional[int] = None, stream_threshold: int = 0):
+    if ijson is None or (expected_size is not None and expected_size < stream_threshold):
+        return BufferedParser()
+    return StreamingParser()
+
+
+async def iter_bytes(data: bytes, size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """A bytes object as the chunk stream ingest_webhook expects"""
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def ingest_webhook(
+    chunks: AsyncIterator[bytes],
+    max_bytes: int,
+    on_turns: Callable[[list, Optional[str]], Awaitable],
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+    expected_size: Optional[int] = None,
+    stream_threshold: int = 0,
+) -> Tuple[dict, int]:
+    """
+    Parse a webhook body chunk by chunk: (payload without the transcript, body size)
+    Transcript turns go to `on_turns(turns, conversation_id)` as they are
+    parsed, and raw chunks to `on_chunk` (the spool). A body whose
+    `expected_size` (Content-Length) is under `stream_threshold` is parsed in
+    one go. Raises WebhookTooLarge past `max_bytes`, and ValueError for
+    malformed JSON.
+    """
+    parser = create_parser(expected_size, stream_threshold)
+    received = 0
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue  # request streams end with b"", which ijson takes as end of input
+            received += len(chunk)
+            if received > max_bytes:
+                raise WebhookTooLarge(f"Webhook body exceeds {max_bytes} bytes")
+            if on_chunk:
+                on_chunk(chunk)
+            turns = parser.feed(chunk)
+            if turns:
+                await on_turns(turns, parser.conversation_id)
+        turns = parser.close()
+    except JSON_ERRORS as e:
+        raise ValueError(f"Invalid JSON: {e}") from None
+    if turns:
+        await on_turns(turns, parser.conversation_id)
+    return parser.payload, received
@@ -6,9 +6,11 @@ Patient Registration Voice Assistant
 import asyncio
 import logging
 import json
+import time
 from datetime import datetime
-from typing import Annotated
+from typing import Annotated, Literal, Optional
 from dotenv import load_dotenv
+import aiohttp
 import os
 
 load_dotenv()
@@ -16,32 +18,23 @@ load_dotenv()
 from livekit.agents import (
     AutoSubscribe,
     JobContext,
+    JobProcess,
+    RunContext,
     WorkerOptions,
     cli,
+    function_tool,
     llm,
 )
 from livekit.agents import voice
 from livekit.plugins import google, deepgram, silero
 
-# Import our database
-from database import patient_registrations
-
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)  # More verbose logging
 logger = logging.getLogger(__name__)
 
 
-async def entrypoint(ctx: JobContext):
-    """Main entry point for the LiveKit agent"""
-    
-    # Patient data storage
-    conversation_id = f"livekit_{ctx.room.name}_{int(datetime.now().timestamp())}"
-    transcript = []
-    
-    logger.info(f"🎤 Starting patient registration session: {conversation_id}")
-
-    # System instructions - tell the agent to greet first
-    initial_instructions = """You are a friendly and professional medical receptionist for VocaCare hospital. 
+# System instructions - tell the agent to greet first
+AGENT_INSTRUCTIONS = """You are a friendly and professional medical receptionist for VocaCare hospital. 
 
 IMPORTANT: When you first connect with a patient, immediately greet them warmly and introduce yourself. Say something like "Hello! Welcome to VocaCare hospital. I'm your AI assistant here to help with your registration today. May I have your full name, please?"
 
@@ -60,37 +53,297 @@ Collect the following information in order:
 9. Emergency contact name and number
 10. Appointment preference (date and time)
 
+As soon as the patient confirms a detail, save it with the record_patient_detail tool
+(once per detail; call it again if the patient corrects something).
+
 After collecting all information, summarize it back to the patient for confirmation.
 Be warm and reassuring. Keep responses brief - 1-2 sentences each.
 Always respond to greetings and maintain a professional yet friendly tone."""
 
+GREETING_INSTRUCTIONS = "Greet the patient warmly, introduce yourself and ask for their full name."
+
+# Transcript turns are posted to the backend's /webhook/livekit in chunks
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+TRANSCRIPT_FLUSH_TURNS = int(os.getenv("AGENT_TRANSCRIPT_FLUSH_TURNS", "6"))
+TRANSCRIPT_FLUSH_SECS = float(os.getenv("AGENT_TRANSCRIPT_FLUSH_SECS", "10"))
+
+
+# Registration fields the agent can record (patient_registrations names)
+PatientField = Literal[
+    "name",
+    "age",
+    "gender",
+    "contact",
+    "address",
+    "reason",
+    "preferredDoctor",
+    "medicalHistory",
+    "emergencyContact",
+    "appointmentPreference",
+]
+
+
+class LiveTrackingUnsupported(Exception):
+    """The backend cannot track calls live (it does not run on MongoDB); retrying will not help"""
+
+
+async def post_to_backend(http: aiohttp.ClientSession, payload: dict) -> bool:
+    """POST a payload to /webhook/livekit; True once the backend accepted it"""
+    async with http.post(f"{BACKEND_URL}/webhook/livekit", json=payload) as response:
+        result = await response.json(content_type=None)
+    if response.status == 200 and result.get("status") == "success":
+        return True
+    if result.get("status") == "unsupported":
+        raise LiveTrackingUnsupported(result.get("message", "live call tracking unsupported"))
+    logger.warning(f"⚠️ Backend rejected {payload.get('type')} update: {result}")
+    return False
+
+
+class FieldRecorder:
+    """
+    Pushes confirmed registration fields to the backend as they are recorded
+    Values that fail to post stay pending (a newer value for the same field
+    replaces them) and go out with the next push.
+    """
+
+    def __init__(self, conversation_id: str, http: aiohttp.ClientSession):
+        self.conversation_id = conversation_id
+        self.http = http
+        self.fields = {}
+        self.pending = {}
+        self.unsupported = False
+        self._lock = asyncio.Lock()
+        self._tasks = set()
+
+    def set(self, field: str, value: str):
+        self.fields[field] = value
+        self.pending[field] = value
+        task = asyncio.create_task(self.push())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def push(self) -> bool:
+        async with self._lock:
+            if self.unsupported:
+                self.pending.clear()
+            if not self.pending:
+                return True
+            fields = dict(self.pending)
+            try:
+                ok = await post_to_backend(self.http, {
+                    "type": "fields",
+                    "conversation_id": self.conversation_id,
+                    "fields": fields,
+                })
+            except LiveTrackingUnsupported as e:
+                logger.warning(f"⚠️ Not recording fields for {self.conversation_id}: {e}")
+                self.unsupported = True
+                self.pending.clear()
+                return True
+            except Exception as e:
+                logger.warning(f"⚠️ Fields {', '.join(fields)} not saved, will retry: {e}")
+                return False
+            if ok:
+                for field, value in fields.items():
+                    if self.pending.get(field) == value:
+                        del self.pending[field]
+            return ok
+
+
+class RegistrationAgent(voice.Agent):
+    """Receptionist agent that records each registration field as it is confirmed"""
+
+    def __init__(self, recorder: FieldRecorder):
+        super().__init__(instructions=AGENT_INSTRUCTIONS)
+        self.recorder = recorder
+
+    @function_tool
+    async def record_patient_detail(self, context: RunContext, field: PatientField, value: str) -> str:
+        """Save one registration detail the patient has just confirmed.
+
+        Args:
+            field: Which registration field the value belongs to.
+            value: The confirmed value, e.g. "John Doe" or "+1 555 0100".
+        """
+        self.recorder.set(field, value)
+        logger.info(f"🧾 Recorded {field}")
+        return f"Saved {field}."
+
+
+class TranscriptBuffer:
+    """
+    Collects conversation turns and posts them to the backend in chunks
+    A flush happens every TRANSCRIPT_FLUSH_TURNS turns or TRANSCRIPT_FLUSH_SECS
+    seconds (see flush_periodically in entrypoint). A chunk that fails to post is retried unchanged (same seq) on the
+    next flush, so the backend can discard chunks it has already applied.
+    """
+
+    def __init__(self, conversation_id: str, http: aiohttp.ClientSession):
+        self.conversation_id = conversation_id
+        self.http = http
+        self.started = time.monotonic()
+        self.turns = []
+        self.seq = 0
+        self.finished = False
+        self.unsupported = False
+        self._unsent: Optional[dict] = None
+        self._lock = asyncio.Lock()
+        self._tasks = set()
+
+    def add(self, role: str, message: str):
+        self.turns.append({
+            "role": role,
+            "message": message,
+            "time_in_call_secs": round(time.monotonic() - self.started, 1),
+        })
+        if len(self.turns) >= TRANSCRIPT_FLUSH_TURNS and not self._lock.locked():
+            task = asyncio.create_task(self.flush())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, final: bool = False) -> bool:
+        async with self._lock:
+            while True:
+                if self.unsupported:
+                    self.turns, self._unsent = [], None
+                    return True
+                if self._unsent is None:
+                    # The final marker is skipped for calls that never said anything
+                    if not self.turns and not (final and self.seq and not self.finished):
+                        return True
+                    self._unsent = {"seq": self.seq, "turns": self.turns, "final": final}
+                    self.turns = []
+                    self.seq += 1
+                if not await self._post(self._unsent):
+                    return False
+                self.finished = self.finished or self._unsent["final"]
+                self._unsent = None
+
+    async def _post(self, chunk: dict) -> bool:
+        payload = {
+            "type": "transcript",
+            "conversation_id": self.conversation_id,
+            **chunk,
+            "call_duration_secs": round(time.monotonic() - self.started, 1),
+        }
+        try:
+            if await post_to_backend(self.http, payload):
+                logger.debug(f"📝 Transcript chunk {chunk['seq']} saved ({len(chunk['turns'])} turns)")
+                return True
+        except LiveTrackingUnsupported as e:
+            logger.warning(f"⚠️ Not posting the transcript for {self.conversation_id}: {e}")
+            self.unsupported = True
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Transcript chunk {chunk['seq']} not saved, will retry: {e}")
+        return False
+
+    async def close(self, attempts: int = 3):
+        """Final flush on disconnect"""
+        for attempt in range(attempts):
+            if await self.flush(final=True):
+                if not self.unsupported:
+                    logger.info(f"💾 Transcript saved: {self.seq} chunk(s)")
+                return
+            await asyncio.sleep(2 ** attempt)
+        logger.error(f"❌ Giving up on transcript for {self.conversation_id}: {len(self.turns)} turn(s) unsaved")
+
+
+def prewarm(proc: JobProcess):
+    """Load the VAD model and create the plugin clients once per worker process"""
+    started = time.perf_counter()
+    proc.userdata["vad"] = silero.VAD.load()
+    proc.userdata["stt"] = deepgram.STT(model="nova-2")
+    proc.userdata["llm"] = google.LLM(model="gemini-2.0-flash-exp")
+    proc.userdata["tts"] = deepgram.TTS(model="aura-asteria-en")  # Deepgram TTS
+    logger.info(f"🔥 Worker prewarmed in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+async def entrypoint(ctx: JobContext):
+    """Main entry point for the LiveKit agent"""
+    job_started = time.perf_counter()
+    
+    # Patient data storage
+    conversation_id = f"livekit_{ctx.room.name}_{int(datetime.now().timestamp())}"
+    http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    transcript = TranscriptBuffer(conversation_id, http)
+    recorder = FieldRecorder(conversation_id, http)
+
+    async def flush_periodically():
+        """Quiet stretches still reach the backend and failed pushes are retried"""
+        while True:
+            await asyncio.sleep(TRANSCRIPT_FLUSH_SECS)
+            await recorder.push()
+            await transcript.flush()
+
+    flush_task = asyncio.create_task(flush_periodically())
+
+    async def save_call():
+        flush_task.cancel()
+        # Fields first, so the completed registration carries all of them
+        for attempt in range(3):
+            if await recorder.push():
+                break
+            await asyncio.sleep(2 ** attempt)
+        else:
+            logger.error(f"❌ Unsaved fields for {conversation_id}: {', '.join(recorder.pending)}")
+        await transcript.close()
+        await http.close()
+
+    ctx.add_shutdown_callback(save_call)
+    
+    logger.info(f"🎤 Starting patient registration session: {conversation_id}")
+
     # Connect to the room
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+    connected = time.perf_counter()
     
     # Create the voice agent
-    agent = voice.Agent(
-        instructions=initial_instructions,
-    )
+    agent = RegistrationAgent(recorder)
 
-    # Create agent session with Gemini for LLM and Deepgram for TTS
+    # Gemini for LLM and Deepgram for STT/TTS, shared from prewarm()
+    shared = ctx.proc.userdata
     session = voice.AgentSession(
-        vad=silero.VAD.load(),
-        stt=deepgram.STT(model="nova-2"),
-        llm=google.LLM(model="gemini-2.0-flash-exp"),
-        tts=deepgram.TTS(model="aura-asteria-en"),  # Deepgram TTS
+        vad=shared["vad"],
+        stt=shared["stt"],
+        llm=shared["llm"],
+        tts=shared["tts"],
     )
 
+    # Session startup latency, logged once the greeting starts playing
+    timings = {"connect": connected - job_started}
+
+    @session.on("agent_state_changed")
+    def log_time_to_greeting(event):
+        if event.new_state == "speaking" and "greeting" not in timings:
+            timings["greeting"] = time.perf_counter() - job_started
+            logger.info(
+                f"⏱️ Time to greeting: {timings['greeting'] * 1000:.0f} ms "
+                f"(connect {timings['connect'] * 1000:.0f} ms, "
+                f"session start {timings.get('session_start', 0) * 1000:.0f} ms)"
+            )
+
+    @session.on("conversation_item_added")
+    def capture_turn(event):
+        item = event.item
+        text = getattr(item, "text_content", None)
+        if text and getattr(item, "role", None) in ("user", "assistant"):
+            transcript.add("agent" if item.role == "assistant" else "user", text)
+
     # Start the session
+    started = time.perf_counter()
     await session.start(room=ctx.room, agent=agent)
+    timings["session_start"] = time.perf_counter() - started
     
     logger.info("🤖 Agent started with Gemini 2.0 Flash!")
-    logger.info("💬 Waiting for patient to speak first...")
+    session.generate_reply(instructions=GREETING_INSTRUCTIONS)
 
 
 if __name__ == "__main__":
-    # Run the LiveKit agent
+    # Run the LiveKit agent; prewarm() runs in each worker process before it takes a job
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
         )
     )
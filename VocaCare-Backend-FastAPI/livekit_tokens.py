@@ -0,0 +1,120 @@
+"""
+LiveKit access token minting
+Credentials are read and validated once at startup. Tokens carry the same
+claims as livekit.api.AccessToken, but the JWT header is pre-encoded and the
+HMAC key schedule is computed once, so each token costs one small JSON dump
+and one HMAC-SHA256 copy instead of building a fresh AccessToken.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+import time
+from typing import List, Optional
+
+import orjson
+
+DEFAULT_TTL_SECS = 6 * 60 * 60
+ROOM_PREFIX = "vocare_room"
+# LiveKit server rejects API secrets shorter than this
+MIN_SECRET_LENGTH = 32
+
+logger = logging.getLogger(__name__)
+
+
+class LiveKitConfigError(ValueError):
+    """LiveKit credentials are missing or malformed"""
+
+
+def _b64(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+
+# Room prefixes from clients; a full name also fits a generated suffix
+ROOM_PREFIX_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+ROOM_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+def new_room_name(prefix: str = ROOM_PREFIX) -> str:
+    """Room name unique across processes: seconds timestamp + 48 random bits"""
+    return f"{prefix}_{int(time.time())}_{secrets.token_hex(6)}"
+
+
+class TokenService:
+    """Mint LiveKit join tokens with a cached HS256 signer"""
+
+    _HEADER = _b64(orjson.dumps({"alg": "HS256", "typ": "JWT"}))
+
+    def __init__(self, url: str, api_key: str, api_secret: str, ttl: int = DEFAULT_TTL_SECS):
+        missing = [
+            name for name, value in (
+                ("LIVEKIT_URL", url),
+                ("LIVEKIT_API_KEY", api_key),
+                ("LIVEKIT_API_SECRET", api_secret),
+            ) if not value
+        ]
+        if missing:
+            raise LiveKitConfigError(
+                f"LiveKit credentials not configured. Please set {', '.join(missing)} in .env file"
+            )
+        if not url.startswith(("wss://", "ws://", "https://", "http://")):
+            raise LiveKitConfigError(f"LIVEKIT_URL must be a ws(s):// or http(s):// URL, got {url!r}")
+        if ttl <= 0:
+            raise LiveKitConfigError("LIVEKIT_TOKEN_TTL_SECS must be positive")
+        if len(api_secret) < MIN_SECRET_LENGTH:
+            logger.warning(f"⚠️ LIVEKIT_API_SECRET is shorter than {MIN_SECRET_LENGTH} characters; LiveKit may reject tokens")
+
+        self.url = url
+        self.api_key = api_key
+        self.ttl = ttl
+        self._mac = hmac.new(api_secret.encode(), digestmod=hashlib.sha256)
+        self.minted = 0
+
+    @classmethod
+    def from_env(cls) -> "TokenService":
+        return cls(
+            os.getenv("LIVEKIT_URL", ""),
+            os.getenv("LIVEKIT_API_KEY", ""),
+            os.getenv("LIVEKIT_API_SECRET", ""),
+            ttl=int(os.getenv("LIVEKIT_TOKEN_TTL_SECS", str(DEFAULT_TTL_SECS))),
+        )
+
+    def sign(self, claims: dict) -> str:
+        signing_input = self._HEADER + b"." + _b64(orjson.dumps(claims))
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return (signing_input + b"." + _b64(mac.digest())).decode()
+
+    def mint(self, participant_name: str = "Patient", room_name: Optional[str] = None,
+             identity: Optional[str] = None) -> dict:
+        """Join token for one participant; a fresh room is generated if none is given"""
+        room_name = room_name or new_room_name()
+        now = int(time.time())
+        token = self.sign({
+            "name": participant_name,
+            "video": {
+                "roomJoin": True,
+                "room": room_name,
+                "canPublish": True,
+                "canSubscribe": True,
+                "canPublishData": True,
+            },
+            "sub": identity or participant_name,
+            "iss": self.api_key,
+            "nbf": now,
+            "exp": now + self.ttl,
+        })
+        self.minted += 1
+        return {"token": token, "url": self.url, "room_name": room_name}
+
+    def mint_batch(self, count: int, participant_name: str = "Patient",
+                   room_prefix: str = ROOM_PREFIX) -> List[dict]:
+        """`count` tokens, each for its own freshly named room"""
+        return [
+            self.mint(participant_name, new_room_name(room_prefix))
+            for _ in range(count)
+        ]
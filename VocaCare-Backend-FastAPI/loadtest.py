@@ -0,0 +1,252 @@
+"""
+Async load test for webhook ingest and the read endpoints
+Drives /webhook/elevenlabs, /api/patients, /api/get-latest-webhook and
+/api/livekit-token at a fixed concurrency with randomized payloads, and
+writes throughput and p50/p95/p99 latency per endpoint to a JSON file.
+
+By default the app runs in-process on the in-memory storage backend
+(pip install httpx):
+
+    python loadtest.py --concurrency 50 --requests 5000
+    python loadtest.py --backend sqlite      # embedded SQLite in a temp directory
+    python loadtest.py --backend mongo       # MONGO_DB_URI; use a throwaway database
+    python loadtest.py --url http://localhost:8000 --duration 30
+    python loadtest.py --mix webhook=1 --output ingest.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import orjson
+
+from send_test_webhook import sample_webhook
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+FIRST_NAMES = ["John", "Jane", "Amit", "Priya", "Carlos", "Mei", "Fatima", "Liam", "Sara", "Omar"]
+LAST_NAMES = ["Doe", "Sharma", "Garcia", "Chen", "Khan", "Smith", "Patel", "Nguyen", "Okafor", "Rossi"]
+REASONS = [
+    "Severe headache and fever",
+    "Chest pain when climbing stairs",
+    "Persistent dry cough",
+    "Lower back pain after lifting",
+    "Skin rash on both arms",
+    "Follow-up for diabetes management",
+    "Sore throat and difficulty swallowing",
+    "Knee swelling after a fall",
+]
+DOCTORS = ["Dr. Sarah Johnson", "Dr. Raj Mehta", "Dr. Emily Clark", "Dr. Ahmed Ali", ""]
+HISTORIES = ["Diabetes, High blood pressure", "Asthma", "None", "Migraine", "Hypothyroidism"]
+
+DEFAULT_MIX = "webhook=4,patients=3,latest=2,token=1"
+
+
+def random_webhook() -> dict:
+    """sample_webhook with a fresh conversation id and randomized patient details"""
+    payload = copy.deepcopy(sample_webhook)
+    data = payload["data"]
+    name = f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}"
+    reason = random.choice(REASONS)
+    results = data["analysis"]["data_collection_results"]
+    results["Name"]["value"] = name
+    results["Age"]["value"] = random.randint(1, 95)
+    results["Gender"]["value"] = random.choice(["Male", "Female", "Other"])
+    results["Contact"]["value"] = str(random.randint(6000000000, 9999999999))
+    results["Reason"]["value"] = reason
+    results["Preferred Doctor"]["value"] = random.choice(DOCTORS)
+    results["Previous Medical History"]["value"] = random.choice(HISTORIES)
+    data["conversation_id"] = f"load_{uuid.uuid4().hex}"
+    data["analysis"]["transcript_summary"] = f"Patient {name} called about: {reason.lower()}."
+    data["transcript"] = data["transcript"][: random.randint(4, len(data["transcript"]))]
+    data["metadata"]["call_duration_secs"] = random.randint(20, 900)
+    return payload
+
+
+async def hit_webhook(client):
+    return await client.post(
+        "/webhook/elevenlabs",
+        content=orjson.dumps(random_webhook()),
+        headers={"Content-Type": "application/json"},
+    )
+
+
+async def hit_patients(client):
+    return await client.get("/api/patients", params={"limit": 50})
+
+
+async def hit_latest(client):
+    return await client.get("/api/get-latest-webhook")
+
+
+async def hit_token(client):
+    return await client.post("/api/livekit-token", json={"participant_name": "Load Test"})
+
+
+SCENARIOS = {
+    "webhook": hit_webhook,
+    "patients": hit_patients,
+    "latest": hit_latest,
+    "token": hit_token,
+}
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0,
+        "mean_ms": round(sum(ordered) / len(ordered), 2) if ordered else 0,
+        "p50_ms": round(percentile(ordered, 50), 2),
+        "p95_ms": round(percentile(ordered, 95), 2),
+        "p99_ms": round(percentile(ordered, 99), 2),
+        "max_ms": round(ordered[-1], 2) if ordered else 0,
+    }
+
+
+async def drive(client, weights: dict, concurrency: int, total: int, duration: float) -> dict:
+    """Run `concurrency` workers until `total` requests or `duration` seconds"""
+    names, cumulative = list(weights), list(weights.values())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        nonlocal issued
+        while (deadline is None and issued < total) or (deadline and time.perf_counter() < deadline):
+            issued += 1
+            name = random.choices(names, cumulative)[0]
+            started = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client)
+                ok = response.status_code == 200 and b'"status":"error"' not in response.content
+            except Exception:
+                ok = False
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {name: summarize(latencies[name], errors[name], elapsed) for name in names}
+    every = [ms for name in names for ms in latencies[name]]
+    return {
+        "elapsed_secs": round(elapsed, 3),
+        "total": summarize(every, sum(errors.values()), elapsed),
+        "endpoints": endpoints,
+    }
+
+
+@contextlib.asynccontextmanager
+async def in_process_client(backend: str):
+    """httpx client wired straight to the ASGI app, with its lifespan running"""
+    # main.py picks its storage when imported
+    os.environ["STORAGE_BACKEND"] = backend
+    scratch = tempfile.mkdtemp(prefix="vocacare-loadtest-")
+    if backend == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(scratch, "loadtest.db")
+    # Keep the webhook journal out of the working directory
+    os.environ["SPOOL_DIR"] = os.path.join(scratch, "spool")
+    # Throwaway credentials so /api/livekit-token can mint locally
+    os.environ.setdefault("LIVEKIT_URL", "wss://loadtest.invalid")
+    os.environ.setdefault("LIVEKIT_API_KEY", "loadtest")
+    os.environ.setdefault("LIVEKIT_API_SECRET", "loadtest-" + "x" * 32)
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            yield client
+
+
+async def run(args) -> dict:
+    weights = parse_mix(args.mix)
+    if args.url:
+        client_context = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        client_context = in_process_client(args.backend)
+
+    # The app logs a few lines per request; keep them off the terminal
+    if not args.verbose:
+        os.environ.setdefault("LOG_LEVEL", "ERROR")
+    async with client_context as client:
+        for _ in range(args.warmup):
+            await hit_webhook(client)
+        results = await drive(client, weights, args.concurrency, args.requests, args.duration)
+
+    return {
+        "started_at": datetime.now().isoformat(),
+        "target": args.url or f"in-process ({args.backend})",
+        "concurrency": args.concurrency,
+        "mix": weights,
+        **results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="run for this many seconds instead")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--warmup", type=int, default=50, help="webhooks sent before measuring")
+    parser.add_argument("--backend", choices=["memory", "sqlite", "mongo"], default="memory")
+    parser.add_argument("--url", help="load test a running server instead of the in-process app")
+    parser.add_argument("--output", default="loadtest-results.json")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log output")
+    args = parser.parse_args()
+
+    if httpx is None:
+        raise SystemExit("Load testing needs httpx. Run: pip install httpx")
+
+    report = asyncio.run(run(args))
+    with open(args.output, "wb") as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+
+    print("=" * 78)
+    print(f"🏋️  {report['target']}: {report['total']['requests']} requests, "
+          f"concurrency {args.concurrency}, {report['elapsed_secs']}s")
+    print("=" * 78)
+    print(f"   {'endpoint':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>9}")
+    for name, stats in [*report["endpoints"].items(), ("total", report["total"])]:
+        print(f"   {name:<10}{stats['throughput_rps']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}{stats['errors']:>9}")
+    print(f"\n📄 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
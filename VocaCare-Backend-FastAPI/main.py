@@ -1,14 +1,178 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 from datetime import datetime
 import uvicorn
 from typing import Optional
 from dotenv import load_dotenv
-from database import patient_registrations
+from analytics import Analytics
+from call_sessions import CallSessions
+from compression import CompressionMiddleware
+from events import EventBroker, SlowConsumer, WebhookLog, format_sse
+from export import CSV_PROJECTION, iter_csv, iter_ndjson
+from indexes import check_indexes, ensure_all_indexes
+from ingest import WebhookTooLarge, ingest_webhook, iter_bytes, streaming_available
+from livekit_tokens import ROOM_NAME_PATTERN, ROOM_PREFIX_PATTERN, LiveKitConfigError, TokenService
+from metrics import MetricsMiddleware, registry, webhook_payload_bytes
+from pagination import DEFAULT_PROJECTION, parse_fields
+from patient_cache import create_patient_cache
+from responses import ORJSONResponse, dumps
+from shared_state import create_state_store
+from spool import Spool
+import orjson
+from schema import build_patient_record
+from stats import StatsCache
+from storage import create_storage, insert_new, project
+from structured_logging import RequestContextMiddleware, bind_conversation, setup_logging
+from transcripts import TranscriptStore, TranscriptStream
+from write_behind import BatchWriter
 import os
 
 load_dotenv()
-app = FastAPI(title="VocaCare Backend API", version="1.0.0")
+setup_logging()
+logger = logging.getLogger("vocacare")
+
+
+def create_writer(collection) -> BatchWriter:
+    """Write-behind batcher configured from the WRITER_* settings"""
+    return BatchWriter(
+        collection,
+        batch_size=int(os.getenv("WRITER_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("WRITER_FLUSH_INTERVAL_MS", "250")) / 1000,
+        queue_size=int(os.getenv("WRITER_QUEUE_SIZE", "5000")),
+        enqueue_timeout=float(os.getenv("WRITER_ENQUEUE_TIMEOUT_SECS", "5")),
+    )
+
+
+# Registrations and transcripts: MongoDB, embedded SQLite or memory (STORAGE_BACKEND)
+storage = create_storage()
+
+# Background writer: webhooks are acknowledged before the database is touched
+writer = create_writer(storage)
+
+# Patient counters kept in memory and reconciled with the database now and then
+stats = StatsCache(
+    storage,
+    max_staleness=float(os.getenv("STATS_MAX_STALENESS_SECS", "30")),
+)
+writer.add_listener(stats.record_inserts, inserted_only=True)
+
+# Full-text search: MongoDB $text, or an embedded index kept current on insert
+writer.add_listener(storage.on_saved)
+
+# GET /api/patients/{id} is served from a read-through cache; saved
+# registrations drop their (possibly negative) entry
+patient_cache = create_patient_cache()
+if patient_cache:
+    writer.add_listener(patient_cache.on_saved)
+
+# Transcripts are compressed into their own collection by a second writer
+transcript_store = TranscriptStore(storage.transcripts, load_chunks=storage.transcript_chunks)
+transcript_writer = create_writer(storage.transcripts)
+TRANSCRIPT_CHUNK_TURNS = int(os.getenv("TRANSCRIPT_CHUNK_TURNS", "200"))
+
+# Larger ElevenLabs webhook bodies are refused with 413; smaller ones than the
+# stream threshold are parsed in one go rather than as they arrive
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+WEBHOOK_STREAM_THRESHOLD_BYTES = int(os.getenv("WEBHOOK_STREAM_THRESHOLD_BYTES", str(256 * 1024)))
+if not streaming_available():
+    logger.warning(
+        "⚠️ ijson not installed: webhook bodies are buffered in memory "
+        "(up to WEBHOOK_MAX_BODY_BYTES) before parsing. Run: pip install ijson"
+    )
+
+# Features built on MongoDB updates and aggregations
+analytics = call_sessions = None
+if storage.name == "mongo":
+    # Hourly/daily rollups for /api/analytics, updated on every saved batch
+    analytics = Analytics(storage.rollups)
+    writer.add_listener(analytics.record)
+
+    # LiveKit calls stream their transcript in chunks while in progress. The
+    # counters count a call's registration when its first update creates it;
+    # completed calls reach the other listeners like batched inserts
+    call_sessions = CallSessions(
+        storage.registrations, transcript_store, transcript_writer,
+        on_complete=lambda records: writer.notify(records, inserted=False),
+        on_insert=stats.record_inserts,
+    )
+
+
+# Every accepted ElevenLabs webhook is journaled to disk before it is
+# acknowledged, and replayed into storage if it never got there
+spool = Spool.from_env()
+SPOOL_REPLAY_INTERVAL_SECS = float(os.getenv("SPOOL_REPLAY_INTERVAL_SECS", "5"))
+SPOOL_REPLAY_DELAY_SECS = float(os.getenv("SPOOL_REPLAY_DELAY_SECS", "30"))
+
+
+def mongo_only(feature: str) -> dict:
+    return {
+        "status": "error",
+        "message": f"{feature} needs STORAGE_BACKEND=mongo (running on {storage.name})"
+    }
+
+# LiveKit token signer, created once in lifespan from the LIVEKIT_* settings
+token_service: Optional[TokenService] = None
+livekit_config_error = "LiveKit token service not initialized"
+LIVEKIT_BATCH_MAX = int(os.getenv("LIVEKIT_BATCH_MAX", "500"))
+
+
+def init_token_service():
+    """Validate LiveKit credentials; the app still starts without them"""
+    global token_service, livekit_config_error
+    try:
+        token_service = TokenService.from_env()
+        logger.info("🎤 LiveKit token service ready")
+    except (LiveKitConfigError, ValueError) as e:
+        token_service = None
+        livekit_config_error = str(e)
+        logger.warning(f"⚠️ LiveKit tokens disabled: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers on startup and drain them on shutdown"""
+    # The MongoDB client is created here; its warm-up ping and index
+    # creation run in the background so an unreachable database does not
+    # hold up startup (readiness reports it instead)
+    await storage.start()
+    index_task = asyncio.create_task(ensure_all_indexes(storage.db)) if storage.name == "mongo" else None
+    init_token_service()
+    await writer.start()
+    await transcript_writer.start()
+    await webhook_state.start(on_remote_event=relay_remote_webhook)
+    replayer = None
+    if spool:
+        await spool.open()
+        replayer = asyncio.create_task(spool.run_replayer(
+            replay_registrations,
+            available=lambda: storage.health()["ready"] and not writer.stalled,
+            interval=SPOOL_REPLAY_INTERVAL_SECS,
+            min_age=SPOOL_REPLAY_DELAY_SECS,
+        ))
+    yield
+    await webhook_state.stop()
+    if index_task:
+        index_task.cancel()
+    await writer.stop()
+    await transcript_writer.stop()
+    if spool:
+        replayer.cancel()
+        await spool.close()
+    if analytics:
+        await analytics.drain()
+    await storage.close()
+
+
+app = FastAPI(
+    title="VocaCare Backend API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # CORS Configuration - Allow frontend to access the API
 app.add_middleware(
@@ -26,8 +190,147 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store the latest webhook data in memory
-latest_webhook_data = None
+# gzip/br/zstd per Accept-Encoding for responses of COMPRESSION_MIN_BYTES or more
+if os.getenv("COMPRESSION_ENABLED", "true").lower() not in ("0", "false", "no"):
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")),
+    )
+# Per-route request counts, latency histograms and in-flight gauges for /metrics
+app.add_middleware(MetricsMiddleware)
+# Correlation id on every log line of a request
+app.add_middleware(RequestContextMiddleware)
+
+MAX_PAGE_SIZE = 1000
+
+# Latest webhook event, shared between workers/replicas per WEBHOOK_STATE_BACKEND
+webhook_state = create_state_store()
+
+# Push channel for dashboards (replaces polling of /api/get-latest-webhook)
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "32"))
+EVENTS_HEARTBEAT_SECS = float(os.getenv("EVENTS_HEARTBEAT_SECS", "15"))
+broker = EventBroker(queue_size=EVENTS_QUEUE_SIZE)
+
+# Recent webhook history so clients can catch up after missing events
+WEBHOOK_LOG_SIZE = int(os.getenv("WEBHOOK_LOG_SIZE", "256"))
+WEBHOOK_LONGPOLL_MAX_SECS = float(os.getenv("WEBHOOK_LONGPOLL_MAX_SECS", "30"))
+webhook_log = WebhookLog(capacity=WEBHOOK_LOG_SIZE)
+
+# Queue depths read when /metrics is scraped
+registry.gauge_callback(
+    "write_behind_pending", "Documents waiting for a batched insert", "collection",
+    lambda: {
+        "patient_registrations": writer.queue.qsize(),
+        "patient_transcripts": transcript_writer.queue.qsize(),
+    },
+)
+registry.gauge_callback(
+    "event_subscribers", "Connected dashboard event streams", "channel",
+    lambda: {"events": broker.subscriber_count},
+)
+if patient_cache:
+    registry.gauge_callback(
+        "patient_cache_lookups", "Patient lookups by cache outcome", "outcome",
+        lambda: {
+            "hit": patient_cache.hits,
+            "negative_hit": patient_cache.negative_hits,
+            "miss": patient_cache.misses,
+        },
+    )
+
+
+async def record_webhook(event: dict, latest: bool = True) -> dict:
+    """Store a webhook event as the latest (unless `latest` is False), log it and push it to subscribers"""
+    entry = webhook_log.append(event)
+    broker.publish(entry)
+    try:
+        await webhook_state.set(entry, latest=latest)
+    except Exception as e:
+        # Only a broadcast aid: never let it fail the webhook being ingested
+        logger.warning(f"⚠️ Could not share webhook event with other workers: {e}")
+    return entry
+
+
+def relay_remote_webhook(event: dict):
+    """Event received by another worker: log and push it here too (seq is per worker)"""
+    broker.publish(webhook_log.append(without_seq(event)))
+
+
+def without_seq(event: dict) -> dict:
+    return {key: value for key, value in event.items() if key != "seq"}
+
+
+async def latest_snapshot() -> Optional[dict]:
+    """
+    Latest event for a client that just connected
+    Sequence numbers are per worker, so an event stored by another worker
+    loses its seq rather than confusing this worker's Last-Event-ID replay
+    """
+    latest = await webhook_state.get()
+    local = webhook_log.latest
+    if latest is None or (local and local.get("seq") == latest.get("seq")
+                          and local.get("timestamp") == latest.get("timestamp")):
+        return latest
+    return without_seq(latest)
+
+
+async def queue_transcript_chunk(chunk: dict):
+    """TranscriptStream sink for live webhooks; the spool replays chunks that miss the queue"""
+    try:
+        await transcript_writer.put(chunk)
+    except asyncio.QueueFull as e:
+        logger.warning(f"⚠️ Transcript chunk not queued: {e}")
+
+
+async def prepare_registration(payload: dict, transcript: TranscriptStream,
+                               received_at: Optional[datetime] = None) -> Optional[dict]:
+    """
+    Patient record for a parsed ElevenLabs payload
+    The transcript was encoded into chunks while parsing; the registration
+    keeps only a pointer. Returns None when the call collected no data.
+    """
+    await transcript.finish((payload.get("data") or {}).get("conversation_id"))
+    patient_record = build_patient_record(payload)
+    if not patient_record:
+        return None
+    patient_record.pop("transcript")
+    if received_at:
+        patient_record["createdAt"] = received_at
+    patient_record["transcriptKeywords"] = transcript.keywords
+    if transcript.chunks:
+        patient_record["transcriptRef"] = transcript.ref()
+    return patient_record
+
+
+async def replay_registrations(entries: list) -> int:
+    """
+    Spool replay: store journaled registrations missing from storage
+    Registrations and chunks already stored are looked up and dropped first
+    (the unique indexes also reject them when they exist); records without a
+    conversationId cannot be told apart from saved ones and are skipped.
+    """
+    records, chunks = [], []
+
+    async def collect(chunk: dict):
+        chunks.append(chunk)
+
+    for received_ms, body in entries:
+        transcript = TranscriptStream(transcript_store, collect, TRANSCRIPT_CHUNK_TURNS)
+        try:
+            payload, _ = await ingest_webhook(
+                iter_bytes(body), len(body), on_turns=transcript.add,
+                expected_size=len(body), stream_threshold=WEBHOOK_STREAM_THRESHOLD_BYTES,
+            )
+        except ValueError:
+            continue
+        record = await prepare_registration(payload, transcript, datetime.fromtimestamp(received_ms / 1000))
+        if record and record["conversationId"]:
+            records.append(record)
+    records, chunks = await storage.unsaved(records, chunks)
+    await insert_new(storage.transcripts, chunks)
+    saved = await insert_new(storage, records)
+    writer.notify(saved)
+    return len(saved)
 
 
 @app.get("/")
@@ -40,65 +343,104 @@ async def root():
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is serving requests (no dependency checks)"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness probe: 503 until storage is reachable
+    For MongoDB that means the warm-up ping succeeded and the circuit
+    breaker is closed
+    """
+    health = storage.health()
+    return ORJSONResponse(
+        {"status": "ready" if health["ready"] else "unavailable", **health},
+        status_code=200 if health["ready"] else 503,
+    )
+
+
 @app.post("/webhook/elevenlabs")
 async def receive_webhook(request: Request):
     """
     Receives webhook data from ElevenLabs
     Configure this URL in your ElevenLabs agent settings
     """
-    global latest_webhook_data
-    
+    staged = None
     try:
-        # Get the webhook payload
-        payload = await request.json()
+        content_length = request.headers.get("content-length", "")
+        expected_size = int(content_length) if content_length.isdigit() else None
+        if expected_size is not None and expected_size > WEBHOOK_MAX_BODY_BYTES:
+            raise WebhookTooLarge(f"Webhook body exceeds {WEBHOOK_MAX_BODY_BYTES} bytes")
+
+        # Parse the body as it arrives: transcript turns are compressed in
+        # chunks, the raw bytes go to the spool. The chunks are only stored
+        # along with a registration, so a call that collected no data (or a
+        # body that fails to parse) leaves no transcript behind
+        staged = spool.stage() if spool else None
+        chunks = []
+
+        async def collect(chunk: dict):
+            chunks.append(chunk)
+
+        transcript = TranscriptStream(transcript_store, collect, TRANSCRIPT_CHUNK_TURNS)
+        payload, size = await ingest_webhook(
+            request.stream(),
+            WEBHOOK_MAX_BODY_BYTES,
+            on_turns=transcript.add,
+            on_chunk=staged.write if staged else None,
+            expected_size=expected_size,
+            stream_threshold=WEBHOOK_STREAM_THRESHOLD_BYTES,
+        )
+        webhook_payload_bytes.observe(size, "elevenlabs")
+
+        # On disk before we acknowledge; replayed if the database save fails
+        if staged:
+            await staged.commit()
         
-        # Add timestamp to the data
-        latest_webhook_data = {
+        # Add timestamp to the data (the transcript itself is not kept here,
+        # only data.transcript_turns)
+        await record_webhook({
             "body": payload,
             "timestamp": int(datetime.now().timestamp() * 1000)  # milliseconds
-        }
+        })
         
-        print(f"✅ Received webhook data at {datetime.now()}")
-        print(f"Conversation ID: {payload.get('data', {}).get('conversation_id', 'N/A')}")
+        bind_conversation((payload.get('data') or {}).get('conversation_id'))
+        logger.info("✅ Received webhook data", extra={"payloadBytes": size})
         
-        # Extract and save patient data to MongoDB
-        if payload.get('data', {}).get('analysis', {}).get('data_collection_results'):
+        # Extract and save patient data to the database
+        patient_record = await prepare_registration(payload, transcript)
+        if patient_record:
             try:
-                results = payload['data']['analysis']['data_collection_results']
-                
-                patient_record = {
-                    "name": results.get('Name', {}).get('value', ''),
-                    "age": results.get('Age', {}).get('value', ''),
-                    "gender": results.get('Gender', {}).get('value', ''),
-                    "contact": results.get('Contact', {}).get('value', ''),
-                    "address": results.get('Address ', {}).get('value', ''),
-                    "reason": results.get('Reason', {}).get('value', ''),
-                    "preferredDoctor": results.get('Preferred Doctor', {}).get('value', ''),
-                    "medicalHistory": results.get('Previous Medical History', {}).get('value', ''),
-                    "emergencyContact": results.get('Emergency Contact', {}).get('value', ''),
-                    "appointmentPreference": results.get('Appointment Preference', {}).get('value', ''),
-                    "conversationId": payload['data'].get('conversation_id'),
-                    "transcript": payload['data'].get('transcript', []),
-                    "transcriptSummary": payload['data'].get('analysis', {}).get('transcript_summary', ''),
-                    "callDuration": payload['data'].get('metadata', {}).get('call_duration_secs'),
-                    "createdAt": datetime.now(),
-                    "status": "completed"
-                }
-                
-                # Save to MongoDB
-                result = await patient_registrations.insert_one(patient_record)
-                print(f"💾 Saved to MongoDB with ID: {result.inserted_id}")
+                # Queue for the database; the background writers batch the inserts
+                for chunk in chunks:
+                    await queue_transcript_chunk(chunk)
+                await writer.put(patient_record)
+                logger.info(f"💾 Queued for {storage.name}", extra={"pending": writer.queue.qsize()})
                 
             except Exception as db_error:
-                print(f"⚠️ MongoDB save failed: {db_error}")
-                print("📝 Continuing without database save...")
+                if spool:
+                    logger.warning(f"⚠️ Database save failed, the spool will replay it: {db_error}")
+                else:
+                    logger.warning(f"⚠️ Database save failed, continuing without database save: {db_error}")
         
         return {"status": "success", "message": "Webhook received"}
+
+    except WebhookTooLarge as e:
+        logger.warning(f"⚠️ Rejected webhook: {e}")
+        return ORJSONResponse({"status": "error", "message": str(e)}, status_code=413)
     
     except Exception as e:
-        print(f"❌ Error processing webhook: {str(e)}")
+        logger.error(f"❌ Error processing webhook: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+    finally:
+        if staged:
+            staged.discard()
+
 
 @app.post("/webhook/livekit")
 async def receive_livekit_webhook(request: Request):
@@ -106,26 +448,58 @@ async def receive_livekit_webhook(request: Request):
     Receives webhook data from LiveKit AI Agent
     Similar to ElevenLabs webhook but for LiveKit
     """
-    global latest_webhook_data
-    
     try:
         # Get the webhook payload
-        payload = await request.json()
-        
-        # Add timestamp to the data
-        latest_webhook_data = {
+        body = await request.body()
+        webhook_payload_bytes.observe(len(body), "livekit")
+        payload = orjson.loads(body)
+        bind_conversation(payload.get('conversation_id') or payload.get('data', {}).get('conversation_id'))
+        if call_sessions is None and payload.get("type") in ("fields", "transcript"):
+            # A status livekit_agent.py stops on instead of retrying
+            return ORJSONResponse(
+                {**mongo_only("Live LiveKit call tracking"), "status": "unsupported"}, status_code=501
+            )
+        event = {
             "body": payload,
             "timestamp": int(datetime.now().timestamp() * 1000),
             "source": "livekit"
         }
+
+        # Registration fields confirmed during the call by the agent's tools:
+        # {"type": "fields", "conversation_id", "fields": {"name": ..., ...}}
+        if payload.get("type") == "fields" and payload.get("conversation_id"):
+            registration = await call_sessions.update_fields(
+                payload["conversation_id"], payload.get("fields") or {}
+            )
+            if patient_cache:
+                patient_cache.invalidate(payload["conversation_id"])
+            # The dashboard renders the partially filled registration live
+            event["registration"] = orjson.loads(dumps(registration))
+            logger.info(f"🧾 Recorded {', '.join(payload.get('fields') or {})}")
         
-        print(f"✅ Received LiveKit webhook data at {datetime.now()}")
-        print(f"Conversation ID: {payload.get('data', {}).get('conversation_id', 'N/A')}")
+        # Log it and push it to dashboards; in-call progress does not replace
+        # the latest registration
+        await record_webhook(event, latest=payload.get("type") not in ("fields", "transcript"))
+        
+        logger.info("✅ Received LiveKit webhook data", extra={"payloadBytes": len(body)})
+
+        # Transcript chunk from livekit_agent.py:
+        # {"type": "transcript", "conversation_id", "seq", "turns", "final", "call_duration_secs"}
+        if payload.get("type") == "transcript" and payload.get("conversation_id"):
+            conversation_id = payload["conversation_id"]
+            applied = await call_sessions.append_transcript(
+                conversation_id, int(payload.get("seq", 0)), payload.get("turns") or []
+            )
+            if patient_cache:
+                patient_cache.invalidate(conversation_id)
+            if payload.get("final"):
+                await call_sessions.complete(conversation_id, payload.get("call_duration_secs"))
+            logger.info(f"📝 Transcript chunk {payload.get('seq', 0)} {'saved' if applied else 'already saved'}")
         
         return {"status": "success", "message": "LiveKit webhook received"}
     
     except Exception as e:
-        print(f"❌ Error processing LiveKit webhook: {str(e)}")
+        logger.error(f"❌ Error processing LiveKit webhook: {str(e)}")
         return {"status": "error", "message": str(e)}
 
 
@@ -134,46 +508,144 @@ async def get_latest_webhook():
     """
     Endpoint that frontend polls to get the latest webhook data
     """
-    if latest_webhook_data is None:
+    latest = await webhook_state.get()
+    if latest is None:
         return {
             "status": "no_data",
             "message": "No webhook data received yet"
         }
     
-    return latest_webhook_data
+    return latest
+
+
+@app.get("/api/webhooks")
+async def list_webhooks(since: int = 0, wait: float = 0):
+    """
+    Long-poll the webhook event log
+    Returns every event after `since`, or waits up to `wait` seconds for one
+    """
+    wait = min(max(wait, 0), WEBHOOK_LONGPOLL_MAX_SECS)
+    result = await webhook_log.wait_since(since, wait)
+    return {"status": "success", **result}
+
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """
+    Server-Sent Events stream of webhook data
+    Sends the current snapshot on connect (or replays from Last-Event-ID on
+    reconnect), then every new webhook as it arrives
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+
+    async def event_stream():
+        # Subscribed inside the generator, so the finally below releases it
+        # however the stream ends (including before it starts). Subscribing
+        # before taking the snapshot means no event falls between the two
+        subscription = broker.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id.isdigit():
+                backlog = webhook_log.since(int(last_event_id))["events"]
+            else:
+                snapshot = await latest_snapshot()
+                backlog = [snapshot] if snapshot else []
+            sent_seq = 0
+            for event in backlog:
+                sent_seq = event.get("seq", sent_seq)
+                yield format_sse(event)
+            while True:
+                event = await subscription.next(timeout=EVENTS_HEARTBEAT_SECS)
+                if event is None:
+                    yield ": heartbeat\n\n"
+                elif event["seq"] > sent_seq:
+                    yield format_sse(event)
+        except SlowConsumer:
+            yield format_sse({"reason": "slow_consumer"}, event="dropped")
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/ws/events")
+async def websocket_events(websocket: WebSocket):
+    """WebSocket variant of /api/events for clients that prefer sockets"""
+    await websocket.accept()
+    subscription = None
+    try:
+        subscription = broker.subscribe()
+        snapshot = await latest_snapshot()
+        if snapshot is not None:
+            await websocket.send_json({"type": "webhook", "data": snapshot})
+        while True:
+            event = await subscription.next(timeout=EVENTS_HEARTBEAT_SECS)
+            if event is None:
+                await websocket.send_json({"type": "heartbeat"})
+            else:
+                await websocket.send_json({"type": "webhook", "data": event})
+    except SlowConsumer:
+        await websocket.close(code=1013, reason="slow consumer")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if subscription is not None:
+            broker.unsubscribe(subscription)
 
 
 @app.delete("/api/clear-webhook")
 async def clear_webhook():
     """Clear the stored webhook data"""
-    global latest_webhook_data
-    latest_webhook_data = None
+    await webhook_state.clear()
     return {"status": "success", "message": "Webhook data cleared"}
 
 
 @app.get("/api/webhook-status")
 async def webhook_status():
     """Check if webhook data is available"""
+    latest = await webhook_state.get()
     return {
-        "has_data": latest_webhook_data is not None,
-        "last_update": latest_webhook_data.get("timestamp") if latest_webhook_data else None
+        "has_data": latest is not None,
+        "last_update": latest.get("timestamp") if latest else None
     }
 
 
 @app.get("/api/patients")
-async def get_all_patients(limit: int = 50):
-    """Get all patient records from MongoDB"""
+async def get_all_patients(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
+):
+    """
+    Get patient records from the database, newest first
+    Pass the returned `next` token as `cursor` to fetch the following page, and
+    `fields=name,reason,...` to return only those fields or
+    `exclude=address,contact,...` to leave those out
+    """
     try:
-        patients = []
-        async for patient in patient_registrations.find().sort("createdAt", -1).limit(limit):
-            patient['_id'] = str(patient['_id'])  # Convert ObjectId to string
-            patients.append(patient)
-        
+        projection = parse_fields(fields, exclude)
+    except ValueError as e:
         return {
+            "status": "error",
+            "message": str(e),
+            "patients": []
+        }
+
+    try:
+        patients, next_cursor = await storage.list(limit, cursor, projection)
+        
+        # ORJSONResponse encodes ObjectId and datetime directly
+        return ORJSONResponse({
             "status": "success",
             "count": len(patients),
-            "patients": patients
-        }
+            "patients": patients,
+            "next": next_cursor
+        })
     except Exception as e:
         return {
             "status": "error",
@@ -182,17 +654,138 @@ async def get_all_patients(limit: int = 50):
         }
 
 
+async def with_transcripts(cursor):
+    """Attach each record's decompressed transcript while streaming"""
+    async for record in cursor:
+        if record.get("transcriptRef"):
+            record["transcript"] = await transcript_store.get(record["conversationId"])
+        yield record
+
+
+@app.get("/api/patients/export")
+async def export_patients(
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_transcript: bool = False,
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
+):
+    """
+    Stream every patient record as CSV or NDJSON
+    Optional `start`/`end` (ISO dates) limit the export to a createdAt window;
+    NDJSON rows take `fields`/`exclude` as for /api/patients (CSV columns are
+    fixed)
+    """
+    if export_format == "csv":
+        projection = CSV_PROJECTION
+    else:
+        try:
+            projection = parse_fields(fields, exclude)
+        except ValueError as e:
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+        if include_transcript and fields:
+            # with_transcripts looks transcripts up by these
+            projection.update(conversationId=1, transcriptRef=1)
+    cursor = storage.iterate(start, end, projection)
+
+    if export_format == "csv":
+        body, media_type, extension = iter_csv(cursor), "text/csv; charset=utf-8", "csv"
+    else:
+        records = with_transcripts(cursor) if include_transcript else cursor
+        body, media_type, extension = iter_ndjson(records), "application/x-ndjson", "ndjson"
+    filename = f"VocaCare_Patients_{datetime.now().date().isoformat()}.{extension}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/api/patients/search")
+async def search_patients(
+    q: str = Query(..., min_length=1, max_length=200),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100),
+    page: int = Query(1, ge=1, le=50),
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
+):
+    """
+    Full-text search over reason, medical history, summary and transcript
+    Results are ranked by relevance; `start`/`end` limit the createdAt window,
+    `fields`/`exclude` the fields returned as for /api/patients
+    """
+    try:
+        projection = parse_fields(fields, exclude)
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "patients": []
+        }
+
+    try:
+        patients = await storage.search(
+            q,
+            start=start,
+            end=end,
+            projection=projection,
+            skip=(page - 1) * limit,
+            limit=limit + 1,
+        )
+        has_more = len(patients) > limit
+        return ORJSONResponse({
+            "status": "success",
+            "query": q,
+            "engine": storage.engine,
+            "page": page,
+            "count": min(len(patients), limit),
+            "has_more": has_more,
+            "patients": patients[:limit]
+        })
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Search error: {str(e)}",
+            "patients": []
+        }
+
+
 @app.get("/api/patients/{conversation_id}")
-async def get_patient_by_id(conversation_id: str):
-    """Get specific patient record by conversation ID"""
+async def get_patient_by_id(
+    conversation_id: str,
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
+):
+    """Get specific patient record by conversation ID (`fields`/`exclude` as for /api/patients)"""
     try:
-        patient = await patient_registrations.find_one({"conversationId": conversation_id})
+        projection = parse_fields(fields, exclude)
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+    try:
+        if patient_cache and not projection.get("transcript"):
+            # The cache holds the default projection; narrower ones are cut from it
+            patient = await patient_cache.get(
+                conversation_id, lambda cid: storage.get(cid, DEFAULT_PROJECTION)
+            )
+            if patient:
+                patient = project(patient, projection)
+        else:
+            patient = await storage.get(conversation_id, projection)
         if patient:
-            patient['_id'] = str(patient['_id'])
-            return {
+            return ORJSONResponse({
                 "status": "success",
                 "patient": patient
-            }
+            })
         else:
             return {
                 "status": "not_found",
@@ -205,92 +798,224 @@ async def get_patient_by_id(conversation_id: str):
         }
 
 
+@app.get("/api/patients/{conversation_id}/transcript")
+async def get_patient_transcript(conversation_id: str):
+    """Get the full call transcript for a patient, decompressed on demand"""
+    try:
+        transcript = await transcript_store.get(conversation_id)
+        if transcript is None:
+            # Registrations saved before transcripts moved out still embed them
+            legacy = await storage.get(conversation_id, {"transcript": 1})
+            transcript = legacy.get("transcript") if legacy else None
+        if transcript is None:
+            return {
+                "status": "not_found",
+                "message": "Transcript not found"
+            }
+        return ORJSONResponse({
+            "status": "success",
+            "conversationId": conversation_id,
+            "transcript": transcript
+        })
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Database error: {str(e)}"
+        }
+
+
 @app.get("/api/stats")
 async def get_stats():
-    """Get database statistics"""
-    try:
-        total = await patient_registrations.count_documents({})
-        
+    """
+    Get database statistics
+    Served from in-memory counters; `stats_age_secs` is how long ago they
+    were last reconciled with MongoDB (bounded by STATS_MAX_STALENESS_SECS)
+    """
+    snapshot = await stats.snapshot()
+    if snapshot["last_error"]:
         return {
-            "status": "success",
-            "database": "connected",
-            "total_patients": total,
-            "collection": "patient_registrations"
+            "status": "error",
+            "database": "disconnected",
+            "total_patients": snapshot["total_patients"],
+            "message": snapshot["last_error"],
+            "writer": writer.metrics(),
+            "spool": spool.metrics() if spool else None,
+            "cache": patient_cache.metrics() if patient_cache else None
         }
+
+    return {
+        "status": "success",
+        "database": "connected",
+        "total_patients": snapshot["total_patients"],
+        "collection": "patient_registrations",
+        "storage": storage.name,
+        "stats_age_secs": snapshot["age_secs"],
+        "last_insert_at": snapshot["last_insert_at"],
+        "writer": writer.metrics(),
+        "spool": spool.metrics() if spool else None,
+        "cache": patient_cache.metrics() if patient_cache else None
+    }
+
+
+@app.get("/api/analytics/volume")
+async def analytics_volume(
+    granularity: str = Query("hour", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Call volume per hour or day"""
+    if analytics is None:
+        return mongo_only("Analytics")
+    try:
+        return ORJSONResponse({
+            "status": "success",
+            "granularity": granularity,
+            "buckets": await analytics.volume(granularity, start, end)
+        })
+    except Exception as e:
+        return {"status": "error", "message": f"Database error: {str(e)}"}
+
+
+@app.get("/api/analytics/reasons")
+async def analytics_reasons(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Most common visit reasons"""
+    if analytics is None:
+        return mongo_only("Analytics")
+    try:
+        return {"status": "success", "reasons": await analytics.top("reasons", start, end, limit)}
+    except Exception as e:
+        return {"status": "error", "message": f"Database error: {str(e)}"}
+
+
+@app.get("/api/analytics/doctors")
+async def analytics_doctors(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Demand per preferred doctor"""
+    if analytics is None:
+        return mongo_only("Analytics")
+    try:
+        return {"status": "success", "doctors": await analytics.top("doctors", start, end, limit)}
+    except Exception as e:
+        return {"status": "error", "message": f"Database error: {str(e)}"}
+
+
+@app.get("/api/analytics/call-durations")
+async def analytics_call_durations(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Call duration histogram and average"""
+    if analytics is None:
+        return mongo_only("Analytics")
+    try:
+        return {"status": "success", **await analytics.durations(start, end)}
+    except Exception as e:
+        return {"status": "error", "message": f"Database error: {str(e)}"}
+
+
+@app.get("/api/admin/indexes")
+async def index_report():
+    """Report index usage, missing indexes and query plans that scan the collection"""
+    if storage.name != "mongo":
+        return mongo_only("The index report")
+    try:
+        return {"status": "success", **await check_indexes(storage.registrations)}
     except Exception as e:
         return {
             "status": "error",
-            "database": "disconnected",
-            "total_patients": 0,
-            "message": str(e)
+            "message": f"Database error: {str(e)}"
         }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request, MongoDB and ingest metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/livekit-token")
 async def generate_livekit_token(request: Request):
     """Generate LiveKit access token for voice agent connection"""
+    if token_service is None:
+        return {"status": "error", "message": livekit_config_error}
     try:
-        from livekit import api
-        
         body = await request.json()
-        room_name = body.get("room_name", f"vocare_room_{int(datetime.now().timestamp())}")
-        participant_name = body.get("participant_name", "Patient")
-        
-        # Get LiveKit credentials from environment
-        livekit_url = os.getenv("LIVEKIT_URL")
-        livekit_api_key = os.getenv("LIVEKIT_API_KEY")
-        livekit_api_secret = os.getenv("LIVEKIT_API_SECRET")
-        
-        if not all([livekit_url, livekit_api_key, livekit_api_secret]):
+        room_name = body.get("room_name")
+        if room_name is not None and not ROOM_NAME_PATTERN.fullmatch(str(room_name)):
             return {
                 "status": "error",
-                "message": "LiveKit credentials not configured. Please set LIVEKIT_URL, LIVEKIT_API_KEY, and LIVEKIT_API_SECRET in .env file"
+                "message": "room_name may only contain letters, digits, '_' and '-'"
             }
-        
-        # Create access token
-        token = api.AccessToken(livekit_api_key, livekit_api_secret)
-        token.with_identity(participant_name)
-        token.with_name(participant_name)
-        token.with_grants(api.VideoGrants(
-            room_join=True,
-            room=room_name,
-            can_publish=True,
-            can_subscribe=True,
-        ))
-        
-        jwt_token = token.to_jwt()
-        
-        return {
-            "status": "success",
-            "token": jwt_token,
-            "url": livekit_url,
-            "room_name": room_name
-        }
-        
-    except ImportError:
+        token = token_service.mint(
+            participant_name=body.get("participant_name", "Patient"),
+            room_name=room_name,
+        )
+        return {"status": "success", **token}
+
+    except Exception as e:
         return {
             "status": "error",
-            "message": "LiveKit SDK not installed. Run: pip install livekit"
+            "message": f"Failed to generate LiveKit token: {str(e)}"
         }
+
+
+@app.post("/api/livekit-token/batch")
+async def generate_livekit_tokens(request: Request):
+    """
+    Mint `count` tokens at once, each for its own new room
+    Used to pre-provision kiosks; count is capped by LIVEKIT_BATCH_MAX
+    """
+    if token_service is None:
+        return {"status": "error", "message": livekit_config_error}
+    try:
+        body = await request.json()
+        count = int(body.get("count", 1))
+        if not 1 <= count <= LIVEKIT_BATCH_MAX:
+            return {
+                "status": "error",
+                "message": f"count must be between 1 and {LIVEKIT_BATCH_MAX}"
+            }
+        room_prefix = str(body.get("room_prefix", "vocare_room"))
+        if not ROOM_PREFIX_PATTERN.fullmatch(room_prefix):
+            return {
+                "status": "error",
+                "message": "room_prefix may only contain letters, digits, '_' and '-'"
+            }
+        tokens = token_service.mint_batch(
+            count,
+            participant_name=body.get("participant_name", "Patient"),
+            room_prefix=room_prefix,
+        )
+        return {"status": "success", "count": len(tokens), "tokens": tokens}
+
     except Exception as e:
         return {
             "status": "error",
-            "message": f"Failed to generate LiveKit token: {str(e)}"
+            "message": f"Failed to generate LiveKit tokens: {str(e)}"
         }
 
 
 if __name__ == "__main__":
-    print("🚀 Starting VocaCare FastAPI Backend...")
-    print("📡 Webhook endpoint: http://localhost:8000/webhook/elevenlabs")
-    print("� LiveKit webhook: http://localhost:8000/webhook/livekit")
-    print("�🔄 Polling endpoint: http://localhost:8000/api/get-latest-webhook")
-    print("🎤 LiveKit token: http://localhost:8000/api/livekit-token")
-    print("📊 API Docs: http://localhost:8000/docs")
+    logger.info("🚀 Starting VocaCare FastAPI Backend...")
+    logger.info("📡 Webhook endpoint: http://localhost:8000/webhook/elevenlabs")
+    logger.info("🎙️ LiveKit webhook: http://localhost:8000/webhook/livekit")
+    logger.info("🔄 Polling endpoint: http://localhost:8000/api/get-latest-webhook")
+    logger.info("📺 Live events (SSE): http://localhost:8000/api/events")
+    logger.info("🎤 LiveKit token: http://localhost:8000/api/livekit-token")
+    logger.info("📊 API Docs: http://localhost:8000/docs")
     
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True  # Auto-reload on code changes
+        reload=True,  # Auto-reload on code changes
+        log_config=None  # keep uvicorn's logs on the queue set up by setup_logging()
     )
 
@@ -0,0 +1,107 @@
+"""
+Keyset pagination, and field projection for patient read endpoints
+Pages are ordered by (createdAt, _id) descending; the opaque cursor encodes
+the last row of the previous page so every page is a bounded index range scan
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+SORT_ORDER = [("createdAt", -1), ("_id", -1)]
+
+# Fields a client may request with ?fields=
+PATIENT_FIELDS = {
+    "name",
+    "age",
+    "gender",
+    "contact",
+    "address",
+    "reason",
+    "preferredDoctor",
+    "medicalHistory",
+    "emergencyContact",
+    "appointmentPreference",
+    "conversationId",
+    "transcript",
+    "transcriptRef",
+    "transcriptSummary",
+    "callDuration",
+    "source",
+    "createdAt",
+    "status",
+}
+
+
+# Returned whatever ?fields= or ?exclude= say (with _id)
+ALWAYS_RETURNED = {"createdAt"}
+
+# Transcripts are served by /api/patients/{conversation_id}/transcript and
+# transcriptKeywords only feeds the search index
+DEFAULT_PROJECTION = {"transcript": 0, "transcriptKeywords": 0}
+
+
+def encode_cursor(record: dict) -> str:
+    """Opaque token pointing just past `record`"""
+    created_at = record.get("createdAt")
+    raw = json.dumps({
+        "t": created_at.isoformat() if isinstance(created_at, datetime) else None,
+        "id": str(record["_id"]),
+    })
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Optional[datetime], ObjectId]:
+    """Inverse of encode_cursor; raises ValueError on a malformed token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = datetime.fromisoformat(raw["t"]) if raw["t"] else None
+        return created_at, ObjectId(raw["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def keyset_filter(token: str) -> dict:
+    """MongoDB filter selecting rows that sort after the cursor position"""
+    created_at, oid = decode_cursor(token)
+    if created_at is None:
+        # Legacy rows without createdAt sort last; page through them by _id
+        return {"createdAt": None, "_id": {"$lt": oid}}
+    return {"$or": [
+        {"createdAt": {"$lt": created_at}},
+        {"createdAt": created_at, "_id": {"$lt": oid}},
+        {"createdAt": None},
+    ]}
+
+
+def _field_list(value: str) -> set:
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested - PATIENT_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+
+def parse_fields(fields: Optional[str], exclude: Optional[str] = None) -> dict:
+    """
+    Turn ?fields=name,age,reason or ?exclude=address,contact into a MongoDB projection
+    `fields` keeps only the listed fields and `exclude` drops them from the
+    default set; the two cannot be combined. createdAt and _id are always
+    returned because the cursor needs them. Without either, every field
+    except transcript data is returned. Raises ValueError on unknown field
+    names.
+    """
+    if fields and exclude:
+        raise ValueError("Use either fields or exclude, not both")
+    if exclude:
+        projection = dict(DEFAULT_PROJECTION)
+        projection.update({name: 0 for name in _field_list(exclude) - ALWAYS_RETURNED})
+        return projection
+    if not fields:
+        return dict(DEFAULT_PROJECTION)
+    return {name: 1 for name in _field_list(fields) | ALWAYS_RETURNED}
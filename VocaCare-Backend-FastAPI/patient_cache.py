@@ -0,0 +1,336 @@
+"""
+Read-through cache for single-patient lookups
+GET /api/patients/{conversation_id} is called over and over for the same few
+conversations. Records are cached for PATIENT_CACHE_TTL_SECS, and lookups
+that found nothing for PATIENT_CACHE_NEGATIVE_TTL_SECS, in a store chosen by
+PATIENT_CACHE_BACKEND:
+
+    memory  an LRU bounded to PATIENT_CACHE_SIZE entries in this process (default)
+    mmap    a memory-mapped file shared by every worker on one host
+    none    no caching
+
+Saved registrations (the write-behind listener) and LiveKit field updates
+invalidate their entry, so a registration is visible as soon as it is stored.
+Concurrent misses for the same conversation share one database read.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+import orjson
+
+from responses import dumps
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[str], Awaitable[Optional[dict]]]
+
+# Cached "not found"
+MISSING = object()
+
+
+class PatientCache:
+    """In-process LRU with TTL and negative caching"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0, negative_ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self._loading: dict = {}
+        # Bumped by every invalidation: a read that started before one is
+        # not cached, since it may have missed the write
+        self._epoch = 0
+
+        # Metrics
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get(self, conversation_id: str, load: Loader) -> Optional[dict]:
+        """The cached record, or load(conversation_id) on a miss (None if there is none)"""
+        cached = self._lookup(conversation_id)
+        if cached is not None:
+            if cached is MISSING:
+                self.negative_hits += 1
+                return None
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        pending = self._loading.get(conversation_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = asyncio.ensure_future(self._load(conversation_id, load))
+        self._loading[conversation_id] = pending
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            if pending.done():
+                self._loading.pop(conversation_id, None)
+
+    async def _load(self, conversation_id: str, load: Loader) -> Optional[dict]:
+        epoch = self._current_epoch()
+        try:
+            record = await load(conversation_id)
+        finally:
+            self._loading.pop(conversation_id, None)
+        if record is None:
+            self._store(conversation_id, MISSING, self.negative_ttl, epoch)
+        else:
+            self._store(conversation_id, record, self.ttl, epoch)
+        return record
+
+    def invalidate(self, conversation_id: Optional[str]):
+        if not conversation_id:
+            return
+        self.invalidations += 1
+        self._evict(conversation_id)
+
+    def on_saved(self, documents: list):
+        """BatchWriter listener: drop entries (including cached misses) for saved registrations"""
+        for document in documents:
+            self.invalidate(document.get("conversationId"))
+
+    def _lookup(self, conversation_id: str):
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[conversation_id]
+            return None
+        self._entries.move_to_end(conversation_id)
+        return value
+
+    def _current_epoch(self) -> int:
+        return self._epoch
+
+    def _store(self, conversation_id: str, value, ttl: float, epoch: int):
+        """Cache `value` unless an invalidation happened since `epoch` was read"""
+        if ttl <= 0 or epoch != self._epoch:
+            return
+        self._entries[conversation_id] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _evict(self, conversation_id: str):
+        self._epoch += 1
+        self._entries.pop(conversation_id, None)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "backend": self.name,
+            "size": self.size(),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class MmapPatientCache(PatientCache):
+    """
+    Cache table in a memory-mapped file shared by the workers on one host
+    The file is a set-associative hash table: a conversationId hashes to a set
+    of `ways` fixed-size slots, and a new entry replaces an empty, expired or
+    least recently used slot of its set. Each slot holds its key, so hash
+    collisions never return another patient's record. Records larger than a
+    slot are not cached. Every access holds an flock on the file, and the
+    invalidation epoch lives in the file header so it covers all workers.
+    """
+
+    name = "mmap"
+    _FILE_HEADER = struct.Struct("<4sIIIQ")  # magic, slots, slot bytes, ways, epoch
+    _SLOT_HEADER = struct.Struct("<QddIH")  # key hash, expires, last used, payload length, key length
+    _MAGIC = b"VCPC"
+    _NEGATIVE = 0xFFFFFFFF
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 60.0, negative_ttl: float = 5.0,
+                 slot_bytes: int = 4096, ways: int = 8):
+        if fcntl is None:
+            raise RuntimeError("The mmap patient cache needs fcntl (Linux/macOS)")
+        import mmap
+
+        super().__init__(max_entries, ttl, negative_ttl)
+        self.path = path
+        self.ways = ways
+        self.sets = max(1, max_entries // ways)
+        self.slot_bytes = slot_bytes
+        self.slots = self.sets * ways
+        self.oversized = 0
+        size = self._FILE_HEADER.size + self.slots * slot_bytes
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            layout = self._FILE_HEADER.unpack_from(self._map, 0)[:4]
+            if layout != (self._MAGIC, self.slots, slot_bytes, ways):
+                # New file, or one laid out by different settings
+                self._map[:] = bytes(size)
+                self._FILE_HEADER.pack_into(self._map, 0, self._MAGIC, self.slots, slot_bytes, ways, 0)
+
+    def _locked(self):
+        fd = self._fd
+
+        class _Lock:
+            def __enter__(self):
+                fcntl.flock(fd, fcntl.LOCK_EX)
+
+            def __exit__(self, *exc):
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+        return _Lock()
+
+    @staticmethod
+    def _hash(conversation_id: str) -> int:
+        # hash() differs between processes; the table is shared
+        return int.from_bytes(hashlib.blake2b(conversation_id.encode(), digest_size=8).digest(), "little") or 1
+
+    def _set_offsets(self, key_hash: int):
+        first = (key_hash % self.sets) * self.ways
+        return [self._FILE_HEADER.size + (first + way) * self.slot_bytes for way in range(self.ways)]
+
+    def _epoch_at(self) -> int:
+        return self._FILE_HEADER.unpack_from(self._map, 0)[4]
+
+    def _current_epoch(self) -> int:
+        with self._locked():
+            return self._epoch_at()
+
+    def _find(self, key: bytes, key_hash: int) -> Optional[int]:
+        for offset in self._set_offsets(key_hash):
+            slot_hash, _, _, _, key_length = self._SLOT_HEADER.unpack_from(self._map, offset)
+            start = offset + self._SLOT_HEADER.size
+            if slot_hash == key_hash and self._map[start:start + key_length] == key:
+                return offset
+        return None
+
+    def _lookup(self, conversation_id: str):
+        key = conversation_id.encode()
+        key_hash = self._hash(conversation_id)
+        now = time.time()
+        with self._locked():
+            offset = self._find(key, key_hash)
+            if offset is None:
+                return None
+            _, expires, _, length, key_length = self._SLOT_HEADER.unpack_from(self._map, offset)
+            if expires < now:
+                self._clear(offset)
+                return None
+            self._SLOT_HEADER.pack_into(self._map, offset, key_hash, expires, now, length, key_length)
+            if length == self._NEGATIVE:
+                return MISSING
+            start = offset + self._SLOT_HEADER.size + key_length
+            payload = self._map[start:start + length]
+        return orjson.loads(payload)
+
+    def _store(self, conversation_id: str, value, ttl: float, epoch: int):
+        if ttl <= 0:
+            return
+        key = conversation_id.encode()
+        payload = b"" if value is MISSING else dumps(value)
+        if self._SLOT_HEADER.size + len(key) + len(payload) > self.slot_bytes:
+            self.oversized += 1
+            return
+        key_hash = self._hash(conversation_id)
+        now = time.time()
+        with self._locked():
+            if epoch != self._epoch_at():
+                return
+            offset = self._find(key, key_hash)
+            if offset is None:
+                offset = self._free_slot(key_hash, now)
+            start = offset + self._SLOT_HEADER.size
+            self._map[start:start + len(key)] = key
+            self._map[start + len(key):start + len(key) + len(payload)] = payload
+            length = self._NEGATIVE if value is MISSING else len(payload)
+            self._SLOT_HEADER.pack_into(self._map, offset, key_hash, now + ttl, now, length, len(key))
+
+    def _free_slot(self, key_hash: int, now: float) -> int:
+        """An empty or expired slot of the key's set, else its least recently used one"""
+        victim, victim_used = None, None
+        for offset in self._set_offsets(key_hash):
+            slot_hash, expires, last_used, _, _ = self._SLOT_HEADER.unpack_from(self._map, offset)
+            if slot_hash == 0 or expires < now:
+                return offset
+            if victim is None or last_used < victim_used:
+                victim, victim_used = offset, last_used
+        self.evictions += 1
+        return victim
+
+    def _clear(self, offset: int):
+        self._SLOT_HEADER.pack_into(self._map, offset, 0, 0.0, 0.0, 0, 0)
+
+    def _evict(self, conversation_id: str):
+        key_hash = self._hash(conversation_id)
+        with self._locked():
+            magic, slots, slot_bytes, ways, epoch = self._FILE_HEADER.unpack_from(self._map, 0)
+            self._FILE_HEADER.pack_into(self._map, 0, magic, slots, slot_bytes, ways, epoch + 1)
+            offset = self._find(conversation_id.encode(), key_hash)
+            if offset is not None:
+                self._clear(offset)
+
+    def size(self) -> int:
+        now = time.time()
+        count = 0
+        with self._locked():
+            for slot in range(self.slots):
+                offset = self._FILE_HEADER.size + slot * self.slot_bytes
+                slot_hash, expires, _, _, _ = self._SLOT_HEADER.unpack_from(self._map, offset)
+                if slot_hash and expires >= now:
+                    count += 1
+        return count
+
+    def metrics(self) -> dict:
+        return {**super().metrics(), "oversized": self.oversized}
+
+
+def create_patient_cache(backend: Optional[str] = None) -> Optional[PatientCache]:
+    """Cache named by PATIENT_CACHE_BACKEND; None when disabled"""
+    backend = backend or os.getenv("PATIENT_CACHE_BACKEND", "memory")
+    if backend == "none":
+        return None
+    settings = dict(
+        max_entries=int(os.getenv("PATIENT_CACHE_SIZE", "10000")),
+        ttl=float(os.getenv("PATIENT_CACHE_TTL_SECS", "60")),
+        negative_ttl=float(os.getenv("PATIENT_CACHE_NEGATIVE_TTL_SECS", "5")),
+    )
+    try:
+        if backend == "mmap":
+            return MmapPatientCache(
+                os.getenv("PATIENT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "vocacare-patient-cache.bin")),
+                slot_bytes=int(os.getenv("PATIENT_CACHE_SLOT_BYTES", "4096")),
+                **settings,
+            )
+        if backend != "memory":
+            logger.warning(f"⚠️ Unknown PATIENT_CACHE_BACKEND {backend!r}, using memory")
+    except (RuntimeError, OSError) as e:
+        logger.warning(f"⚠️ {e}; caching patient lookups in this process only")
+    return PatientCache(**settings)
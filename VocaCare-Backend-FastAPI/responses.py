@@ -0,0 +1,29 @@
+"""
+Fast JSON responses backed by orjson
+MongoDB documents can be returned as-is: ObjectId is encoded as a string and
+datetime natively as ISO 8601, with no per-document conversion loop
+"""
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson
+    Return it directly from an endpoint to skip FastAPI's jsonable_encoder pass
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
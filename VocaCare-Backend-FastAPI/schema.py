@@ -0,0 +1,75 @@
+"""
+Patient record schema for ElevenLabs webhooks
+The mapping from data_collection_results to patient_registrations fields is
+declared once here and applied by one function shared by every backend entry
+point
+"""
+
+from datetime import datetime
+from typing import Optional
+
+# patient_registrations field -> data_collection_results key(s), first match wins.
+# The ElevenLabs agent was configured with a trailing space on "Address ",
+# so both spellings are accepted.
+PATIENT_FIELD_MAP = {
+    "name": ("Name",),
+    "age": ("Age",),
+    "gender": ("Gender",),
+    "contact": ("Contact",),
+    "address": ("Address ", "Address"),
+    "reason": ("Reason",),
+    "preferredDoctor": ("Preferred Doctor",),
+    "medicalHistory": ("Previous Medical History",),
+    "emergencyContact": ("Emergency Contact",),
+    "appointmentPreference": ("Appointment Preference",),
+}
+
+# patient_registrations field -> (path under payload["data"], default value or
+# factory for mutable defaults)
+CALL_FIELD_MAP = {
+    "conversationId": (("conversation_id",), None),
+    "transcript": (("transcript",), list),
+    "transcriptSummary": (("analysis", "transcript_summary"), ""),
+    "callDuration": (("metadata", "call_duration_secs"), None),
+}
+
+
+# Shared read-only default for missing results and call data
+EMPTY: dict = {}
+
+
+def extract_patient_fields(data: dict, results: dict) -> dict:
+    """Apply PATIENT_FIELD_MAP and CALL_FIELD_MAP to a webhook's data and data_collection_results"""
+    record = {}
+    for field, keys in PATIENT_FIELD_MAP.items():
+        result = EMPTY
+        for key in keys:
+            if results.get(key):
+                result = results[key]
+                break
+        record[field] = result.get("value", "")
+    for field, (path, default) in CALL_FIELD_MAP.items():
+        parent = data
+        for key in path[:-1]:
+            parent = parent.get(key, EMPTY)
+        if callable(default):
+            record[field] = parent.get(path[-1]) or default()
+        else:
+            record[field] = parent.get(path[-1], default)
+    record["createdAt"] = datetime.now()
+    record["status"] = "completed"
+    return record
+
+
+def build_patient_record(payload: dict) -> Optional[dict]:
+    """
+    Build a patient_registrations document from an ElevenLabs webhook payload
+    Returns None when the call produced no data collection results
+    """
+    data = payload.get("data")
+    if not data:
+        return None
+    results = data.get("analysis", {}).get("data_collection_results")
+    if not results:
+        return None
+    return extract_patient_fields(data, results)
@@ -0,0 +1,222 @@
+"""
+Full-text search over patient registrations
+MongoDB's $text index (see indexes.py) is the primary engine. When the text
+index is missing, or SEARCH_BACKEND=memory, an embedded inverted index built
+from the collection and kept current by the write-behind writer is used
+instead.
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import re
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+INDEX_NOT_FOUND = 27
+
+logger = logging.getLogger(__name__)
+
+# Searchable fields and their relevance weights (mirrored by the text index)
+TEXT_WEIGHTS = {
+    "reason": 10,
+    "medicalHistory": 5,
+    "transcriptSummary": 3,
+    "transcriptKeywords": 1,
+}
+
+# Cap on distinct transcript terms stored per registration
+MAX_KEYWORDS = 500
+
+STOPWORDS = frozenset("""
+a about am an and any are as at be been but by can could did do does for from
+had has have hello hi how i i'm if in is it it's its just me my no not of okay
+on or our please so that the their them then there they this to too um uh us
+was we were what when where which who will with would yes you your
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with plurals folded"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def transcript_keywords(turns: Iterable[dict]) -> List[str]:
+    """Distinct terms from transcript messages, stored for the text index"""
+    seen = {}
+    for turn in turns or []:
+        message = turn.get("message") if isinstance(turn, dict) else None
+        if not message:
+            continue
+        for token in tokenize(message):
+            seen.setdefault(token, None)
+            if len(seen) >= MAX_KEYWORDS:
+                return list(seen)
+    return list(seen)
+
+
+class InvertedIndex:
+    """
+    Compact in-process inverted index with weighted tf-idf ranking
+    Postings are parallel arrays of document numbers and weights, so several
+    hundred thousand registrations fit in modest memory.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Tuple[array, array]] = defaultdict(
+            lambda: (array("I"), array("f"))
+        )
+        self._conversation_ids: List[str] = []
+        self._created: array = array("d")
+        self._doc_numbers: Dict[str, int] = {}
+        self.active = False
+        self.ready = False
+
+    def __len__(self):
+        return len(self._conversation_ids)
+
+    def add(self, record: dict):
+        conversation_id = record.get("conversationId")
+        if not conversation_id or conversation_id in self._doc_numbers:
+            return
+        doc = len(self._conversation_ids)
+        self._doc_numbers[conversation_id] = doc
+        self._conversation_ids.append(conversation_id)
+        created_at = record.get("createdAt")
+        self._created.append(created_at.timestamp() if isinstance(created_at, datetime) else 0.0)
+
+        weights: Dict[str, float] = defaultdict(float)
+        for field, weight in TEXT_WEIGHTS.items():
+            value = record.get(field)
+            if isinstance(value, list):
+                value = " ".join(str(item) for item in value)
+            for token in tokenize(str(value or "")):
+                weights[token] += weight
+        for token, weight in weights.items():
+            docs, scores = self._postings[token]
+            docs.append(doc)
+            scores.append(1 + math.log(weight))
+
+    def add_documents(self, records: list):
+        """BatchWriter listener; inserts racing a build are deduplicated"""
+        if self.active:
+            for record in records:
+                self.add(record)
+
+    async def build(self, collection, batch_size: int = 1000):
+        """Index every registration, streaming only the searchable fields"""
+        self.active = True
+        projection = {field: 1 for field in TEXT_WEIGHTS}
+        projection.update({"conversationId": 1, "createdAt": 1, "_id": 0})
+        async for record in collection.find({}, projection).batch_size(batch_size):
+            self.add(record)
+        self.ready = True
+
+    def search(
+        self,
+        query: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 20,
+    ) -> List[Tuple[str, float]]:
+        """Top `limit` (conversationId, score) pairs for the query"""
+        total = len(self._conversation_ids) or 1
+        low = start.timestamp() if start else float("-inf")
+        high = end.timestamp() if end else float("inf")
+        scores: Dict[int, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            if token not in self._postings:
+                continue
+            docs, weights = self._postings[token]
+            idf = math.log(1 + total / len(docs))
+            for doc, weight in zip(docs, weights):
+                if low <= self._created[doc] < high:
+                    scores[doc] += weight * idf
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(self._conversation_ids[doc], round(score, 4)) for doc, score in best]
+
+
+class PatientSearch:
+    """Run a search on $text, falling back to the embedded index"""
+
+    def __init__(self, collection, backend: str = "auto"):
+        self.collection = collection
+        self.backend = backend
+        self.index = InvertedIndex()
+        self._use_index = backend == "memory"
+        self._build_task: Optional[asyncio.Task] = None
+
+    @property
+    def engine(self) -> str:
+        return "memory" if self._use_index else "text"
+
+    async def start(self):
+        if self._use_index:
+            await self._ensure_index()
+
+    async def _ensure_index(self):
+        # Concurrent callers share one build
+        if self._build_task is None:
+            self._build_task = asyncio.create_task(self.index.build(self.collection))
+        await asyncio.shield(self._build_task)
+
+    async def search(
+        self,
+        query: str,
+        filters: dict,
+        projection: dict,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        skip: int,
+        limit: int,
+    ) -> List[dict]:
+        """Up to `limit` matching records after `skip`, best match first"""
+        if not self._use_index:
+            try:
+                return await self._text_search(query, filters, projection, skip, limit)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND or self.backend != "auto":
+                    raise
+                logger.warning("⚠️ Text index missing, falling back to the embedded search index")
+                self._use_index = True
+        await self._ensure_index()
+        return await self._index_search(query, projection, start, end, skip, limit)
+
+    async def _text_search(self, query, filters, projection, skip, limit):
+        query_filter = {"$text": {"$search": query}, **filters}
+        projection = {**projection, "score": {"$meta": "textScore"}}
+        cursor = (
+            self.collection.find(query_filter, projection)
+            .sort([("score", {"$meta": "textScore"}), ("createdAt", -1)])
+            .skip(skip)
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+
+    async def _index_search(self, query, projection, start, end, skip, limit):
+        hits = self.index.search(query, start, end, limit=skip + limit)[skip:]
+        if not hits:
+            return []
+        scores = dict(hits)
+        if 1 in projection.values():
+            projection = {**projection, "conversationId": 1}
+        records = await self.collection.find(
+            {"conversationId": {"$in": list(scores)}}, projection
+        ).to_list(length=len(scores))
+        for record in records:
+            record["score"] = scores.get(record.get("conversationId"), 0)
+        return sorted(records, key=lambda record: record["score"], reverse=True)
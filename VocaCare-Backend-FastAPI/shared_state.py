@@ -0,0 +1,290 @@
+"""
+Shared latest-webhook state for multi-worker and multi-node deployments
+The latest webhook event (served by /api/get-latest-webhook and
+/api/webhook-status) lives in a pluggable store chosen by
+WEBHOOK_STATE_BACKEND:
+
+    memory  this process only (default; single worker)
+    mmap    a memory-mapped file shared by every worker on one host
+    redis   a Redis server shared by every host (pip install redis)
+
+mmap and redis also tell each worker about events received by the others, so
+SSE, WebSocket and long-poll clients see every webhook whichever worker they
+are connected to (mmap keeps the last 64 events in a ring that each worker
+polls; a worker that falls further behind logs the events it missed).
+Progress events, such as LiveKit field and transcript updates, are relayed
+but do not replace the latest event.
+"""
+
+import asyncio
+import logging
+import os
+import struct
+import tempfile
+import uuid
+from typing import Callable, Optional
+
+import orjson
+
+from responses import dumps
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional dependency
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+RemoteEventHandler = Callable[[dict], None]
+
+
+class MemoryState:
+    """Latest event held in this process"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._latest: Optional[dict] = None
+
+    async def start(self, on_remote_event: Optional[RemoteEventHandler] = None):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def set(self, event: dict, latest: bool = True):
+        """Share `event` with the other workers, and keep it as the latest unless `latest` is False"""
+        if latest:
+            self._latest = event
+
+    async def get(self) -> Optional[dict]:
+        return self._latest
+
+    async def clear(self):
+        self._latest = None
+
+
+class MmapState(MemoryState):
+    """
+    Latest event and recent events in a memory-mapped file, for several workers on one host
+    Layout: a header (latest version, its writer pid and length, events
+    written), the latest event as JSON, then a ring of `ring_slots` fixed-size
+    slots holding every event in order. Writers hold an exclusive flock and
+    readers a shared one. Each worker polls the ring from its own cursor, so
+    it relays every event the other workers wrote unless more than
+    `ring_slots` arrive between two polls (those are counted and logged).
+    """
+
+    name = "mmap"
+    _HEADER = struct.Struct("<QIIQ")  # latest version, latest writer pid, latest length, events written
+    _SLOT = struct.Struct("<QII")  # event number + 1, writer pid, length
+
+    def __init__(self, path: str, max_bytes: int = 4 * 1024 * 1024, poll_interval: float = 0.2,
+                 ring_slots: int = 64):
+        if fcntl is None:
+            raise RuntimeError("The mmap webhook state backend needs fcntl (Linux/macOS)")
+        import mmap
+
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.ring_slots = ring_slots
+        # Half the file for the latest event, half for the ring
+        self.slot_bytes = (max_bytes // 2) // ring_slots
+        self._ring_start = max_bytes - ring_slots * self.slot_bytes
+        self.capacity = self._ring_start - self._HEADER.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != max_bytes:
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, max_bytes)
+        self._map = mmap.mmap(self._fd, max_bytes)
+        self._version = -1
+        self._cursor = 0
+        self._poller: Optional[asyncio.Task] = None
+        self.missed = 0
+
+    def _locked(self, exclusive: bool):
+        fd = self._fd
+
+        class _Lock:
+            def __enter__(self):
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+            def __exit__(self, *exc):
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+        return _Lock()
+
+    def _shrink(self, payload: bytes, event: dict, capacity: int, where: str) -> bytes:
+        if len(payload) <= capacity:
+            return payload
+        logger.warning(f"⚠️ Webhook event of {len(payload)} bytes is too large for the shared {where}; "
+                       "sharing its timestamp only")
+        return dumps({k: event[k] for k in ("seq", "timestamp", "source") if k in event})
+
+    def _write(self, payload: Optional[bytes], ring_payload: Optional[bytes] = None):
+        with self._locked(exclusive=True):
+            version, pid, length, written = self._HEADER.unpack_from(self._map, 0)
+            if ring_payload is not None:
+                offset = self._ring_start + (written % self.ring_slots) * self.slot_bytes
+                start = offset + self._SLOT.size
+                self._map[start:start + len(ring_payload)] = ring_payload
+                self._SLOT.pack_into(self._map, offset, written + 1, os.getpid(), len(ring_payload))
+                if self._cursor == written:
+                    self._cursor += 1  # caught up: no need to read our own event back
+                written += 1
+            if payload is not None:
+                start = self._HEADER.size
+                self._map[start:start + len(payload)] = payload
+                version, pid, length = version + 1, os.getpid(), len(payload)
+            self._HEADER.pack_into(self._map, 0, version, pid, length, written)
+
+    def _read(self):
+        """(version, writer pid, latest event) — the event is only decoded when it changed"""
+        with self._locked(exclusive=False):
+            version, pid, length, _ = self._HEADER.unpack_from(self._map, 0)
+            if version == self._version:
+                return version, pid, self._latest
+            payload = self._map[self._HEADER.size:self._HEADER.size + length]
+        self._version = version
+        self._latest = orjson.loads(payload) if length else None
+        return version, pid, self._latest
+
+    def _read_ring(self) -> list:
+        """Events other workers wrote since the last call"""
+        events = []
+        with self._locked(exclusive=False):
+            written = self._HEADER.unpack_from(self._map, 0)[3]
+            if written - self._cursor > self.ring_slots:
+                self.missed += written - self._cursor - self.ring_slots
+                logger.warning(f"⚠️ {written - self._cursor - self.ring_slots} shared webhook event(s) "
+                               "were overwritten before this worker relayed them")
+                self._cursor = written - self.ring_slots
+            for number in range(self._cursor, written):
+                offset = self._ring_start + (number % self.ring_slots) * self.slot_bytes
+                slot_number, pid, length = self._SLOT.unpack_from(self._map, offset)
+                if slot_number == number + 1 and pid != os.getpid():
+                    start = offset + self._SLOT.size
+                    events.append(self._map[start:start + length])
+            self._cursor = written
+        return [orjson.loads(payload) for payload in events]
+
+    async def start(self, on_remote_event: Optional[RemoteEventHandler] = None):
+        self._read()
+        with self._locked(exclusive=False):
+            self._cursor = self._HEADER.unpack_from(self._map, 0)[3]
+        if on_remote_event:
+            self._poller = asyncio.create_task(self._poll(on_remote_event))
+
+    async def stop(self):
+        if self._poller:
+            self._poller.cancel()
+            self._poller = None
+
+    async def _poll(self, on_remote_event: RemoteEventHandler):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                for event in self._read_ring():
+                    on_remote_event(event)
+            except Exception as e:
+                logger.warning(f"⚠️ Shared webhook state poll failed: {e}")
+
+    async def set(self, event: dict, latest: bool = True):
+        payload = dumps(event)
+        ring_payload = self._shrink(payload, event, self.slot_bytes - self._SLOT.size, "event ring")
+        self._write(self._shrink(payload, event, self.capacity, "latest event") if latest else None, ring_payload)
+        if latest:
+            self._version = -1  # re-read our own write on the next get()
+
+    async def get(self) -> Optional[dict]:
+        return self._read()[2]
+
+    async def clear(self):
+        self._write(b"")
+        self._version = -1
+
+
+class RedisState(MemoryState):
+    """Latest event in Redis, with pub/sub relaying events between nodes"""
+
+    name = "redis"
+
+    def __init__(self, url: str, key: str = "vocacare:latest_webhook", channel: str = "vocacare:webhooks"):
+        if aioredis is None:
+            raise RuntimeError("The redis webhook state backend needs redis. Run: pip install redis")
+        super().__init__()
+        self.client = aioredis.from_url(url)
+        self.key = key
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, on_remote_event: Optional[RemoteEventHandler] = None):
+        if on_remote_event:
+            self._listener = asyncio.create_task(self._listen(on_remote_event))
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        await self.client.aclose()
+
+    async def _listen(self, on_remote_event: RemoteEventHandler):
+        delay = 0.5
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    delay = 0.5
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        envelope = orjson.loads(message["data"])
+                        if envelope["origin"] != self.instance_id:
+                            on_remote_event(envelope["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Redis webhook relay disconnected, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def set(self, event: dict, latest: bool = True):
+        payload = dumps(event)
+        envelope = b'{"origin":"' + self.instance_id.encode() + b'","event":' + payload + b"}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            if latest:
+                pipe.set(self.key, payload)
+            pipe.publish(self.channel, envelope)
+            await pipe.execute()
+
+    async def get(self) -> Optional[dict]:
+        payload = await self.client.get(self.key)
+        return orjson.loads(payload) if payload else None
+
+    async def clear(self):
+        await self.client.delete(self.key)
+
+
+def create_state_store(backend: Optional[str] = None) -> MemoryState:
+    """Store named by WEBHOOK_STATE_BACKEND; falls back to memory if it cannot start"""
+    backend = backend or os.getenv("WEBHOOK_STATE_BACKEND", "memory")
+    try:
+        if backend == "mmap":
+            return MmapState(
+                os.getenv("WEBHOOK_STATE_PATH", os.path.join(tempfile.gettempdir(), "vocacare-latest-webhook.bin")),
+                max_bytes=int(os.getenv("WEBHOOK_STATE_MAX_BYTES", str(4 * 1024 * 1024))),
+            )
+        if backend == "redis":
+            return RedisState(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        if backend != "memory":
+            logger.warning(f"⚠️ Unknown WEBHOOK_STATE_BACKEND {backend!r}, using memory")
+    except (RuntimeError, OSError) as e:
+        logger.warning(f"⚠️ {e}; keeping webhook state in this process only")
+    return MemoryState()
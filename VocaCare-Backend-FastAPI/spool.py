@@ -0,0 +1,413 @@
+"""
+Durable on-disk spool for accepted webhooks
+Every ElevenLabs webhook body is appended to a local journal before it is
+acknowledged, so a registration survives a database outage, a full write
+queue or a crash. A background replayer later drains the journal into
+patient_registrations, skipping registrations that are already stored.
+
+The journal is a directory of append-only segment files. Each record is a
+16-byte header (payload length, CRC32, receipt time in ms) followed by the
+raw body. Appends go straight to the file; fsync is batched: one background
+fsync covers every append made during SPOOL_FSYNC_INTERVAL_MS (group commit).
+With SPOOL_DURABILITY=fsync (default) append() returns once its record is on
+disk; with SPOOL_DURABILITY=write it returns as soon as the record is in the
+OS page cache (sub-millisecond; survives a process crash, and the background
+fsync bounds what a power cut can lose). The replayer reads segments through
+mmap and records its position in a checkpoint file.
+
+Each worker process locks its own worker-N directory under SPOOL_DIR, so
+several uvicorn workers can share one SPOOL_DIR; a restarted worker picks up
+a free directory, including whatever a previous process left unreplayed.
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+import uuid
+import zlib
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows: one worker per SPOOL_DIR
+    fcntl = None
+
+HEADER = struct.Struct("<IIQ")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CHECKPOINT = "checkpoint.json"
+STAGING_SUFFIX = ".incoming"
+COPY_BLOCK = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+# (receipt time in ms, payload)
+Entry = Tuple[int, bytes]
+
+
+def _segment_name(number: int) -> str:
+    return f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+
+
+def read_records(path: str, start: int = 0, end: Optional[int] = None):
+    """Yield (offset after the record, receipt ms, payload) for each intact record"""
+    size = os.path.getsize(path) if end is None else end
+    if size <= start:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as view:
+        offset = start
+        while offset + HEADER.size <= size:
+            length, crc, received_ms = HEADER.unpack_from(view, offset)
+            body_start = offset + HEADER.size
+            if body_start + length > size:
+                return  # torn write at the tail
+            payload = view[body_start:body_start + length]
+            if zlib.crc32(payload) != crc:
+                return
+            offset = body_start + length
+            yield offset, received_ms, payload
+
+
+class Spool:
+    """Segmented append-only journal with group-commit fsync"""
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024,
+                 fsync_interval: float = 0.002, durability: str = "fsync"):
+        if durability not in ("fsync", "write"):
+            raise ValueError("SPOOL_DURABILITY must be fsync or write")
+        self.root = directory
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.durability = durability
+        self._fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        self._segment = 0
+        self._size = 0
+        self._retired: List[int] = []
+        self._waiters: List[asyncio.Future] = []
+        self._dirty = asyncio.Event()
+        # Held while a record is written, so records never interleave
+        self._append_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self.checkpoint = (0, 0)
+
+        # Metrics
+        self.appended = 0
+        self.replayed = 0
+        self.skipped = 0
+        self.fsyncs = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["Spool"]:
+        if os.getenv("SPOOL_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            os.getenv("SPOOL_DIR", "spool"),
+            segment_bytes=int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024))),
+            fsync_interval=float(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "2")) / 1000,
+            durability=os.getenv("SPOOL_DURABILITY", "fsync"),
+        )
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, _segment_name(number))
+
+    def segments(self) -> List[int]:
+        return sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _claim_directory(self):
+        """Lock the first worker-N directory no other process holds"""
+        slot = 0
+        while True:
+            directory = os.path.join(self.root, f"worker-{slot}")
+            os.makedirs(directory, exist_ok=True)
+            fd = os.open(os.path.join(directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            if fcntl is None:
+                break
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                os.close(fd)
+                slot += 1
+        self.directory = directory
+        self._lock_fd = fd
+
+    async def open(self):
+        """Recover the tail of the last segment and start the fsync task"""
+        self._claim_directory()
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT), "rb") as f:
+                saved = orjson.loads(f.read())
+            self.checkpoint = (saved["segment"], saved["offset"])
+        except FileNotFoundError:
+            pass
+
+        # Bodies that were still arriving when the process died were never acknowledged
+        for name in os.listdir(self.directory):
+            if name.endswith(STAGING_SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+
+        segments = self.segments()
+        self._segment = segments[-1] if segments else max(self.checkpoint[0], 1)
+        path = self._path(self._segment)
+        if os.path.exists(path):
+            # A crash can leave a partial record; cut it off before appending
+            valid = self.checkpoint[1] if self.checkpoint[0] == self._segment else 0
+            for valid, _, _ in read_records(path, valid):
+                pass
+            if valid < os.path.getsize(path):
+                logger.warning(f"⚠️ Spool: discarding a torn record at the end of {path}")
+                os.truncate(path, valid)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._size = os.fstat(self._fd).st_size
+        self._flusher = asyncio.create_task(self._flush_loop())
+        pending = self.pending_segments()
+        if pending:
+            logger.info(f"📼 Spool: {len(pending)} segment(s) awaiting replay in {self.directory}")
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        async with self._append_lock:
+            await self._close()
+
+    async def _close(self):
+        await asyncio.to_thread(self._sync, [*self._retired, self._fd])
+        self._retired = []
+        for waiter in self._waiters:
+            waiter.set_result(None)
+        self._waiters = []
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # releases the flock
+            self._lock_fd = None
+
+    async def append(self, payload: bytes, received_ms: Optional[int] = None):
+        """Journal one payload; returns once it is as durable as SPOOL_DURABILITY asks"""
+        received_ms = received_ms or int(time.time() * 1000)
+        record = HEADER.pack(len(payload), zlib.crc32(payload), received_ms) + payload
+        async with self._append_lock:
+            self._reserve(len(record))
+            os.write(self._fd, record)
+            self._size += len(record)
+        await self._appended()
+
+    def stage(self) -> "StagedRecord":
+        """Start a record whose payload arrives in chunks (see StagedRecord)"""
+        return StagedRecord(self)
+
+    def _reserve(self, length: int):
+        if self._size and self._size + length > self.segment_bytes:
+            self._rotate()
+
+    async def _appended(self):
+        self.appended += 1
+        self._dirty.set()
+        if self.durability == "fsync":
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+    def _rotate(self):
+        # The old segment is fsynced and closed by the flush loop
+        self._retired.append(self._fd)
+        self._segment += 1
+        self._fd = os.open(self._path(self._segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._size = 0
+
+    def _sync(self, fds: List[int]):
+        for fd in fds:
+            if fd is not None:
+                os.fsync(fd)
+        self.fsyncs += 1
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            # Let appends arriving in the next few ms share this fsync
+            await asyncio.sleep(self.fsync_interval)
+            self._dirty.clear()
+            waiters, self._waiters = self._waiters, []
+            retired, self._retired = self._retired, []
+            try:
+                await asyncio.to_thread(self._sync, [*retired, self._fd])
+            except Exception as e:
+                logger.error(f"❌ Spool fsync failed: {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            for fd in retired:
+                os.close(fd)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def pending_segments(self) -> List[int]:
+        return [number for number in self.segments() if number >= self.checkpoint[0]]
+
+    def _save_checkpoint(self, segment: int, offset: int):
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + ".tmp", "wb") as f:
+            f.write(orjson.dumps({"segment": segment, "offset": offset}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.checkpoint = (segment, offset)
+        # Segments before the checkpoint are fully replayed
+        for number in self.segments():
+            if number < segment:
+                os.remove(self._path(number))
+
+    def _read_batch(self, limit: int, max_bytes: int, before_ms: int,
+                    active: Tuple[int, int]) -> Tuple[List[Entry], Tuple[int, int]]:
+        """
+        Up to `limit` entries / `max_bytes` after the checkpoint received before `before_ms`
+        Runs in a thread while the event loop keeps appending, so `active` is
+        the (segment, size) being appended to as read on the loop: anything
+        written or rotated in after that is left for the next call.
+        """
+        active_segment, active_size = active
+        segment, offset = self.checkpoint
+        entries: List[Entry] = []
+        size = 0
+        for number in self.pending_segments():
+            if number > active_segment:
+                break
+            start = offset if number == segment else 0
+            end = active_size if number == active_segment else None
+            for next_offset, received_ms, payload in read_records(self._path(number), start, end):
+                if received_ms >= before_ms or len(entries) >= limit or (entries and size >= max_bytes):
+                    return entries, (segment, offset)
+                entries.append((received_ms, payload))
+                size += len(payload)
+                segment, offset = number, next_offset
+            if number == active_segment:
+                break
+            # Read to the end of a finished segment: move past it even if it
+            # ended in a torn record
+            segment, offset = number + 1, 0
+        return entries, (segment, offset)
+
+    async def replay(self, handle: Callable[[List[Entry]], Awaitable[int]], min_age: float = 0,
+                     batch_size: int = 500, batch_bytes: int = 8 * 1024 * 1024) -> int:
+        """
+        Feed journaled entries older than `min_age` seconds to `handle` in batches
+        `handle` returns how many entries it stored (the rest were already
+        there); the checkpoint only advances after it succeeds, so a failed
+        batch is retried on the next call.
+        """
+        total = 0
+        while True:
+            before_ms = int((time.time() - min_age) * 1000)
+            active = (self._segment, self._size)
+            entries, position = await asyncio.to_thread(
+                self._read_batch, batch_size, batch_bytes, before_ms, active
+            )
+            if position == self.checkpoint:
+                return total
+            stored = await handle(entries) if entries else 0
+            self.replayed += stored
+            self.skipped += len(entries) - stored
+            total += stored
+            await asyncio.to_thread(self._save_checkpoint, *position)
+
+    async def run_replayer(self, handle: Callable[[List[Entry]], Awaitable[int]],
+                           available: Callable[[], bool], interval: float = 5.0, min_age: float = 30.0):
+        """Drain the journal every `interval` seconds while the database is available"""
+        while True:
+            await asyncio.sleep(interval)
+            if not available():
+                continue
+            try:
+                stored = await self.replay(handle, min_age)
+                if stored:
+                    logger.info(f"📼 Spool: replayed {stored} registration(s) missing from the database")
+            except Exception as e:
+                logger.warning(f"⚠️ Spool replay paused: {e}")
+
+    def metrics(self) -> dict:
+        return {
+            "segment": self._segment,
+            "segment_bytes": self._size,
+            "pending_segments": len(self.pending_segments()) if self._fd is not None else 0,
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "skipped": self.skipped,
+            "fsyncs": self.fsyncs,
+            "durability": self.durability,
+        }
+
+
+class StagedRecord:
+    """
+    A spool record written while its payload streams in
+    Chunks go to a staging file next to the segments, so a large body is
+    never held in memory; commit() copies it into the journal as one record,
+    in a worker thread so a large body does not hold up the event loop.
+    """
+
+    def __init__(self, spool: Spool):
+        self.spool = spool
+        self.received_ms = int(time.time() * 1000)
+        self.path = os.path.join(spool.directory, uuid.uuid4().hex + STAGING_SUFFIX)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        self.length = 0
+        self._crc = 0
+        self._committing = False
+
+    def write(self, chunk: bytes):
+        os.write(self._fd, chunk)
+        self._crc = zlib.crc32(chunk, self._crc)
+        self.length += len(chunk)
+
+    async def commit(self):
+        """Append the record; returns once it is as durable as SPOOL_DURABILITY asks"""
+        # Shielded: a copy that has started finishes even if the request is
+        # cancelled, and discard() leaves the staging file to it
+        self._committing = True
+        await asyncio.shield(self._commit())
+
+    async def _commit(self):
+        spool = self.spool
+        try:
+            async with spool._append_lock:
+                spool._reserve(HEADER.size + self.length)
+                await asyncio.to_thread(self._copy, spool._fd, spool._size)
+                spool._size += HEADER.size + self.length
+        finally:
+            self._committing = False
+            self.discard()
+        await spool._appended()
+
+    def _copy(self, fd: int, size: int):
+        try:
+            os.write(fd, HEADER.pack(self.length, self._crc, self.received_ms))
+            offset = 0
+            while offset < self.length:
+                block = os.pread(self._fd, min(COPY_BLOCK, self.length - offset), offset)
+                os.write(fd, block)
+                offset += len(block)
+        except OSError:
+            # Do not leave a partial record in front of later appends
+            os.ftruncate(fd, size)
+            raise
+
+    def discard(self):
+        if self._fd is not None and not self._committing:
+            os.close(self._fd)
+            os.remove(self.path)
+            self._fd = None
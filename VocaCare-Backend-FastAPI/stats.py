@@ -0,0 +1,72 @@
+"""
+In-memory patient statistics
+Counters are bumped on every successful insert and reconciled against the
+storage's count (MongoDB's collection metadata, estimated_document_count)
+once they are older than the staleness bound, so /api/stats never waits on
+a full count and never reports counters older than the bound
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+
+
+class StatsCache:
+    """Incrementally maintained counters for /api/stats"""
+
+    def __init__(self, storage, max_staleness: float = 30.0):
+        self.storage = storage
+        self.max_staleness = max_staleness
+        self.total_patients = 0
+        self.inserted_since_start = 0
+        self.last_insert_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self._reconciled_at: Optional[float] = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+    def record_inserts(self, documents: list):
+        """BatchWriter listener (inserted_only): count documents newly inserted"""
+        if not documents:
+            return
+        self.total_patients += len(documents)
+        self.inserted_since_start += len(documents)
+        self.last_insert_at = datetime.now()
+
+    async def reconcile(self):
+        """Replace the running total with the storage's count"""
+        try:
+            self.total_patients = await self.storage.count()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+        finally:
+            self._reconciled_at = time.monotonic()
+
+    async def snapshot(self) -> dict:
+        """
+        Current counters, answered from memory
+        Counters older than the staleness bound (and the very first call)
+        wait for a reconcile; concurrent callers share it
+        """
+        if self.age > self.max_staleness:
+            if not self._reconciling:
+                self._reconcile_task = asyncio.create_task(self.reconcile())
+            await asyncio.shield(self._reconcile_task)
+        return {
+            "total_patients": self.total_patients,
+            "inserted_since_start": self.inserted_since_start,
+            "last_insert_at": self.last_insert_at.isoformat() if self.last_insert_at else None,
+            "age_secs": round(self.age, 3),
+            "last_error": self.last_error,
+        }
+
+    @property
+    def age(self) -> float:
+        if self._reconciled_at is None:
+            return float("inf")
+        return time.monotonic() - self._reconciled_at
+
+    @property
+    def _reconciling(self) -> bool:
+        return self._reconcile_task is not None and not self._reconcile_task.done()
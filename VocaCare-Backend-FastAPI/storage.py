@@ -0,0 +1,586 @@
+"""
+Pluggable storage for patient registrations
+STORAGE_BACKEND picks where registrations and transcript chunks live:
+
+    mongo   MongoDB via Motor (default; MONGO_DB_URI)
+    sqlite  an embedded SQLite database in WAL mode (SQLITE_PATH), for
+            clinics running fully local
+    memory  process memory only, for tests and benchmarks
+
+Every backend offers insert_many (the write-behind writer's contract), get,
+list, count, search and iterate (exports). Analytics rollups, live LiveKit
+call sessions and the index report use MongoDB features and are only
+available with the mongo backend.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from pagination import DEFAULT_PROJECTION, SORT_ORDER, decode_cursor, encode_cursor, keyset_filter
+from export import date_range_filter
+from responses import dumps
+from search import InvertedIndex, PatientSearch
+
+DUPLICATE_KEY = 11000
+DATETIME_FIELDS = ("createdAt", "updatedAt")
+
+logger = logging.getLogger(__name__)
+
+
+def project(record: dict, projection: Optional[dict]) -> dict:
+    """Apply a MongoDB-style inclusion or exclusion projection to a record"""
+    if not projection:
+        return dict(record)
+    if any(value == 1 for value in projection.values()):
+        keep = {key for key, value in projection.items() if value == 1}
+        if projection.get("_id", 1):
+            keep.add("_id")
+        return {key: value for key, value in record.items() if key in keep}
+    return {key: value for key, value in record.items() if projection.get(key, 1)}
+
+
+def _duplicate_error(errors: list, inserted: int):
+    """The BulkWriteError an unordered insert_many raises in MongoDB"""
+    return BulkWriteError({"writeErrors": errors, "nInserted": inserted})
+
+
+def _first_unsaved(documents: list, saved: set, key) -> list:
+    """Documents whose key is not in `saved`, keeping the first of any repeats"""
+    unsaved = []
+    for document in documents:
+        if key(document) not in saved:
+            saved.add(key(document))
+            unsaved.append(document)
+    return unsaved
+
+
+async def insert_new(target, documents: list) -> list:
+    """Insert unordered, treating duplicate keys as already stored; returns what was inserted"""
+    if not documents:
+        return []
+    try:
+        await target.insert_many(documents, ordered=False)
+        return documents
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY for error in errors):
+            raise
+        rejected = {error["index"] for error in errors}
+        return [document for i, document in enumerate(documents) if i not in rejected]
+
+
+def _sort_key(record: dict):
+    created_at = record.get("createdAt")
+    return (isinstance(created_at, datetime), created_at or datetime.min, record["_id"])
+
+
+def _in_window(record: dict, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    if not start and not end:
+        return True
+    created_at = record.get("createdAt")
+    if not isinstance(created_at, datetime):
+        return False
+    return (not start or created_at >= start) and (not end or created_at < end)
+
+
+class MongoStorage:
+    """Registrations in MongoDB; search uses $text with the embedded index as fallback"""
+
+    name = "mongo"
+
+    def __init__(self, search_backend: str = "auto"):
+        from database import analytics_rollups, db, mongo, patient_registrations, patient_transcripts
+
+        self.mongo = mongo
+        self.db = db
+        self.registrations = patient_registrations
+        self.transcripts = patient_transcripts
+        self.rollups = analytics_rollups
+        self.search_engine = PatientSearch(patient_registrations, backend=search_backend)
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def engine(self) -> str:
+        return self.search_engine.engine
+
+    async def start(self):
+        """Create the client; warm-up and index building run in the background"""
+        self.mongo.connect()
+        self._tasks = [
+            asyncio.create_task(self.mongo.warm_up()),
+            asyncio.create_task(self.search_engine.start()),
+        ]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self.mongo.close()
+
+    def health(self) -> dict:
+        breaker = self.mongo.breaker
+        return {
+            "ready": self.mongo.ready,
+            "storage": self.name,
+            "circuit": breaker.state,
+            "circuit_opened": breaker.opened,
+            "last_error": breaker.last_error,
+        }
+
+    def on_saved(self, documents: list):
+        """BatchWriter listener keeping the fallback search index current"""
+        self.search_engine.index.add_documents(documents)
+
+    async def insert_many(self, documents: list, ordered: bool = False):
+        return await self.registrations.insert_many(documents, ordered=ordered)
+
+    async def unsaved(self, records: list, chunks: list) -> Tuple[list, list]:
+        """
+        Spool replay: drop registrations and transcript chunks already stored
+        The unique indexes would reject them too, but those are built best
+        effort and cannot be built on collections that already hold duplicate
+        conversationIds.
+        """
+        ids = list({document["conversationId"] for document in records + chunks})
+        if not ids:
+            return records, chunks
+        query = {"conversationId": {"$in": ids}}
+        saved = {
+            document["conversationId"]
+            async for document in self.registrations.find(query, {"conversationId": 1, "_id": 0})
+        }
+        saved_chunks = {
+            (document["conversationId"], document["seq"])
+            async for document in self.transcripts.find(query, {"conversationId": 1, "seq": 1, "_id": 0})
+        }
+        return (
+            _first_unsaved(records, saved, lambda document: document["conversationId"]),
+            _first_unsaved(chunks, saved_chunks, lambda chunk: (chunk["conversationId"], chunk["seq"])),
+        )
+
+    async def get(self, conversation_id: str, projection: Optional[dict] = DEFAULT_PROJECTION) -> Optional[dict]:
+        return await self.registrations.find_one({"conversationId": conversation_id}, projection)
+
+    async def list(self, limit: int, cursor: Optional[str] = None,
+                   projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+        """Newest-first page plus the cursor for the next one (ValueError on a bad cursor)"""
+        query = keyset_filter(cursor) if cursor else {}
+        cursor = self.registrations.find(query, projection).sort(SORT_ORDER).limit(limit + 1)
+        records = await cursor.to_list(length=limit + 1)
+        if len(records) > limit:
+            records.pop()
+            return records, encode_cursor(records[-1])
+        return records, None
+
+    async def count(self) -> int:
+        return await self.registrations.estimated_document_count()
+
+    async def search(self, query: str, start: Optional[datetime], end: Optional[datetime],
+                     projection: dict, skip: int, limit: int) -> List[dict]:
+        return await self.search_engine.search(
+            query,
+            filters=date_range_filter(start, end),
+            projection=projection,
+            start=start,
+            end=end,
+            skip=skip,
+            limit=limit,
+        )
+
+    def iterate(self, start: Optional[datetime], end: Optional[datetime], projection: dict):
+        """Every record in the window, oldest first, streamed from a cursor"""
+        cursor = self.registrations.find(date_range_filter(start, end), projection)
+        return cursor.sort("createdAt", 1).batch_size(500)
+
+    async def transcript_chunks(self, conversation_id: str) -> List[dict]:
+        cursor = self.transcripts.find({"conversationId": conversation_id}).sort("seq", 1)
+        return await cursor.to_list(length=None)
+
+
+class MemoryStorage:
+    """Registrations in process memory; search uses the embedded inverted index"""
+
+    name = "memory"
+    engine = "memory"
+
+    def __init__(self):
+        self._records: List[dict] = []
+        self._by_conversation = {}
+        self._chunks = {}
+        self.index = InvertedIndex()
+        self.index.active = self.index.ready = True
+        self.transcripts = _MemoryTranscripts(self._chunks)
+        self.registrations = self.rollups = None
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def on_saved(self, documents: list):
+        pass
+
+    def health(self) -> dict:
+        return {"ready": True, "storage": self.name}
+
+    async def insert_many(self, documents: list, ordered: bool = False):
+        errors = []
+        for i, document in enumerate(documents):
+            conversation_id = document.get("conversationId")
+            if conversation_id and conversation_id in self._by_conversation:
+                errors.append({"index": i, "code": DUPLICATE_KEY})
+                continue
+            document.setdefault("_id", ObjectId())
+            self._records.append(document)
+            if conversation_id:
+                self._by_conversation[conversation_id] = document
+            self.index.add(document)
+        if errors:
+            raise _duplicate_error(errors, len(documents) - len(errors))
+
+    async def unsaved(self, records: list, chunks: list) -> Tuple[list, list]:
+        # insert_many always enforces the unique keys here
+        return records, chunks
+
+    async def get(self, conversation_id: str, projection: Optional[dict] = DEFAULT_PROJECTION) -> Optional[dict]:
+        record = self._by_conversation.get(conversation_id)
+        return project(record, projection) if record else None
+
+    async def list(self, limit: int, cursor: Optional[str] = None,
+                   projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+        records = self._records
+        if cursor:
+            created_at, oid = decode_cursor(cursor)
+            after = (created_at is not None, created_at or datetime.min, oid)
+            records = (record for record in records if _sort_key(record) < after)
+        page = heapq.nlargest(limit + 1, records, key=_sort_key)
+        next_cursor = None
+        if len(page) > limit:
+            page.pop()
+            next_cursor = encode_cursor(page[-1])
+        return [project(record, projection) for record in page], next_cursor
+
+    async def count(self) -> int:
+        return len(self._records)
+
+    async def search(self, query: str, start: Optional[datetime], end: Optional[datetime],
+                     projection: dict, skip: int, limit: int) -> List[dict]:
+        hits = self.index.search(query, start, end, limit=skip + limit)[skip:]
+        results = []
+        for conversation_id, score in hits:
+            record = await self.get(conversation_id, projection)
+            if record is not None:
+                results.append({**record, "score": score})
+        return results
+
+    async def iterate(self, start: Optional[datetime], end: Optional[datetime],
+                      projection: dict) -> AsyncIterator[dict]:
+        for record in sorted(self._records, key=_sort_key):
+            if _in_window(record, start, end):
+                yield project(record, projection)
+
+    async def transcript_chunks(self, conversation_id: str) -> List[dict]:
+        return sorted(self._chunks.get(conversation_id, []), key=lambda chunk: chunk["seq"])
+
+
+class _MemoryTranscripts:
+    """insert_many target for transcript chunks held in memory"""
+
+    name = "memory transcripts"
+
+    def __init__(self, chunks: dict):
+        self._chunks = chunks
+
+    async def insert_many(self, documents: list, ordered: bool = False):
+        errors = []
+        for i, document in enumerate(documents):
+            stored = self._chunks.setdefault(document["conversationId"], [])
+            if any(chunk["seq"] == document["seq"] for chunk in stored):
+                errors.append({"index": i, "code": DUPLICATE_KEY})
+            else:
+                stored.append(document)
+        if errors:
+            raise _duplicate_error(errors, len(documents) - len(errors))
+
+
+class SQLiteStorage:
+    """
+    Registrations in an embedded SQLite database (WAL mode)
+    Documents are stored as JSON next to the columns used for lookups and
+    ordering. SQLite calls are blocking, so they run in thread pools: one
+    writer thread (SQLite allows a single writer) and a few reader threads,
+    each with its own connection; WAL lets readers run alongside the writer.
+    Search uses the embedded inverted index, built from the table on start.
+    """
+
+    name = "sqlite"
+    engine = "memory"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS patients (
+        oid TEXT PRIMARY KEY,
+        conversation_id TEXT UNIQUE,
+        created_at REAL,
+        doc BLOB NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS patients_created ON patients (created_at DESC, oid DESC);
+    CREATE TABLE IF NOT EXISTS transcripts (
+        conversation_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL,
+        turns INTEGER,
+        raw_bytes INTEGER,
+        created_at REAL,
+        PRIMARY KEY (conversation_id, seq)
+    );
+    """
+
+    def __init__(self, path: str, read_threads: int = 4):
+        self.path = path
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="sqlite-write")
+        self._readers = ThreadPoolExecutor(read_threads, thread_name_prefix="sqlite-read")
+        self.index = InvertedIndex()
+        self.transcripts = _SQLiteTranscripts(self)
+        self.registrations = self.rollups = None
+        self.started = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # fsync at checkpoints only; a crash can lose the last commits but never corrupts
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    async def _run(self, executor, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    async def read(self, fn, *args):
+        return await self._run(self._readers, fn, *args)
+
+    async def write(self, fn, *args):
+        return await self._run(self._writer, fn, *args)
+
+    async def insert_rows(self, sql: str, rows: list) -> list:
+        """Insert rows in one transaction; returns writeErrors for rows violating a unique key"""
+        def insert() -> list:
+            connection = self._connection()
+            errors = []
+            connection.execute("BEGIN")
+            try:
+                for i, row in enumerate(rows):
+                    try:
+                        connection.execute(sql, row)
+                    except sqlite3.IntegrityError:
+                        errors.append({"index": i, "code": DUPLICATE_KEY})
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            return errors
+
+        return await self.write(insert)
+
+    async def start(self):
+        await self.write(lambda: self._connection().executescript(self.SCHEMA))
+        self.index.active = True
+        async for record in self.iterate(None, None, None):
+            self.index.add(record)
+        self.index.ready = True
+        self.started = True
+        logger.info(f"🗄️ SQLite storage ready at {self.path} ({len(self.index)} registration(s))")
+
+    async def close(self):
+        def close_connection():
+            connection = getattr(self._local, "connection", None)
+            if connection is not None:
+                connection.close()
+                self._local.connection = None
+
+        await self.write(close_connection)
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=False)
+
+    def on_saved(self, documents: list):
+        pass
+
+    def health(self) -> dict:
+        return {"ready": self.started, "storage": self.name}
+
+    @staticmethod
+    def _decode(oid: str, doc: bytes) -> dict:
+        record = orjson.loads(doc)
+        for field in DATETIME_FIELDS:
+            if isinstance(record.get(field), str):
+                record[field] = datetime.fromisoformat(record[field])
+        return {"_id": ObjectId(oid), **record}
+
+    async def insert_many(self, documents: list, ordered: bool = False):
+        rows = []
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            created_at = document.get("createdAt")
+            rows.append((
+                str(document["_id"]),
+                document.get("conversationId") or None,
+                created_at.timestamp() if isinstance(created_at, datetime) else None,
+                dumps({key: value for key, value in document.items() if key != "_id"}),
+            ))
+
+        errors = await self.insert_rows("INSERT INTO patients VALUES (?, ?, ?, ?)", rows)
+        rejected = {error["index"] for error in errors}
+        for i, document in enumerate(documents):
+            if i not in rejected:
+                self.index.add(document)
+        if errors:
+            raise _duplicate_error(errors, len(documents) - len(errors))
+
+    async def unsaved(self, records: list, chunks: list) -> Tuple[list, list]:
+        # The UNIQUE and PRIMARY KEY constraints are part of the schema
+        return records, chunks
+
+    async def get(self, conversation_id: str, projection: Optional[dict] = DEFAULT_PROJECTION) -> Optional[dict]:
+        row = await self.read(lambda: self._connection().execute(
+            "SELECT oid, doc FROM patients WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone())
+        return project(self._decode(*row), projection) if row else None
+
+    async def list(self, limit: int, cursor: Optional[str] = None,
+                   projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+        sql, params = "SELECT oid, doc FROM patients", []
+        if cursor:
+            created_at, oid = decode_cursor(cursor)
+            if created_at is None:
+                sql += " WHERE created_at IS NULL AND oid < ?"
+                params = [str(oid)]
+            else:
+                sql += " WHERE created_at < ? OR (created_at = ? AND oid < ?) OR created_at IS NULL"
+                params = [created_at.timestamp(), created_at.timestamp(), str(oid)]
+        sql += " ORDER BY created_at DESC, oid DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = await self.read(lambda: self._connection().execute(sql, params).fetchall())
+        records = [self._decode(*row) for row in rows]
+        next_cursor = None
+        if len(records) > limit:
+            records.pop()
+            next_cursor = encode_cursor(records[-1])
+        return [project(record, projection) for record in records], next_cursor
+
+    async def count(self) -> int:
+        row = await self.read(lambda: self._connection().execute("SELECT COUNT(*) FROM patients").fetchone())
+        return row[0]
+
+    async def search(self, query: str, start: Optional[datetime], end: Optional[datetime],
+                     projection: dict, skip: int, limit: int) -> List[dict]:
+        hits = self.index.search(query, start, end, limit=skip + limit)[skip:]
+        if not hits:
+            return []
+        scores = dict(hits)
+        placeholders = ",".join("?" * len(scores))
+        rows = await self.read(lambda: self._connection().execute(
+            f"SELECT oid, doc FROM patients WHERE conversation_id IN ({placeholders})", list(scores)
+        ).fetchall())
+        records = []
+        for row in rows:
+            record = self._decode(*row)
+            records.append({**project(record, projection), "score": scores[record["conversationId"]]})
+        return sorted(records, key=lambda record: record["score"], reverse=True)
+
+    async def iterate(self, start: Optional[datetime], end: Optional[datetime],
+                      projection: Optional[dict], batch_size: int = 500) -> AsyncIterator[dict]:
+        """
+        Every record in the window, oldest first, read in keyset pages
+        Ordered by (createdAt, _id) like the other backends, with records
+        lacking createdAt first, so replayed and migrated rows export in
+        place rather than in insertion order.
+        """
+        window, window_params = [], []
+        if start:
+            window.append("created_at >= ?")
+            window_params.append(start.timestamp())
+        if end:
+            window.append("created_at < ?")
+            window_params.append(end.timestamp())
+        last = None
+        while True:
+            conditions, params = list(window), list(window_params)
+            if last is not None:
+                created_at, oid = last
+                if created_at is None:
+                    conditions.append("((created_at IS NULL AND oid > ?) OR created_at IS NOT NULL)")
+                    params.append(oid)
+                else:
+                    conditions.append("(created_at > ? OR (created_at = ? AND oid > ?))")
+                    params += [created_at, created_at, oid]
+            sql = "SELECT created_at, oid, doc FROM patients"
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            sql += " ORDER BY created_at, oid LIMIT ?"
+            params.append(batch_size)
+            rows = await self.read(lambda: self._connection().execute(sql, params).fetchall())
+            for created_at, oid, doc in rows:
+                yield project(self._decode(oid, doc), projection)
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][:2]
+
+    async def transcript_chunks(self, conversation_id: str) -> List[dict]:
+        rows = await self.read(lambda: self._connection().execute(
+            "SELECT seq, codec, data, turns, raw_bytes FROM transcripts WHERE conversation_id = ? ORDER BY seq",
+            (conversation_id,),
+        ).fetchall())
+        return [
+            {"conversationId": conversation_id, "seq": seq, "codec": codec, "data": data,
+             "turns": turns, "rawBytes": raw_bytes}
+            for seq, codec, data, turns, raw_bytes in rows
+        ]
+
+
+class _SQLiteTranscripts:
+    """insert_many target for transcript chunks in the transcripts table"""
+
+    name = "sqlite transcripts"
+
+    def __init__(self, storage: SQLiteStorage):
+        self.storage = storage
+
+    async def insert_many(self, documents: list, ordered: bool = False):
+        rows = [
+            (doc["conversationId"], doc["seq"], doc["codec"], bytes(doc["data"]), doc.get("turns"),
+             doc.get("rawBytes"), doc["createdAt"].timestamp() if doc.get("createdAt") else None)
+            for doc in documents
+        ]
+        errors = await self.storage.insert_rows("INSERT INTO transcripts VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        if errors:
+            raise _duplicate_error(errors, len(documents) - len(errors))
+
+
+def create_storage(backend: Optional[str] = None):
+    """Storage named by STORAGE_BACKEND (mongo, sqlite or memory)"""
+    backend = backend or os.getenv("STORAGE_BACKEND", "mongo")
+    if backend == "sqlite":
+        return SQLiteStorage(
+            os.getenv("SQLITE_PATH", "vocacare.db"),
+            read_threads=int(os.getenv("SQLITE_READ_THREADS", "4")),
+        )
+    if backend == "memory":
+        return MemoryStorage()
+    if backend != "mongo":
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; choose mongo, sqlite or memory")
+    return MongoStorage(search_backend=os.getenv("SEARCH_BACKEND", "auto"))
@@ -0,0 +1,131 @@
+"""
+Non-blocking structured logging
+Log calls only put the record on an in-memory queue; a background listener
+thread formats it (one JSON object per line by default) and writes it to
+stdout, so a slow log pipe never stalls the event loop. Records carry the
+current request id and conversationId from context variables.
+
+Settings: LOG_LEVEL (default INFO) and LOG_FORMAT (json or text).
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+import orjson
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+conversation_id_var: ContextVar[Optional[str]] = ContextVar("conversation_id", default=None)
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def bind_conversation(conversation_id: Optional[str]):
+    """Tag every log line for the rest of this request with a conversationId"""
+    if conversation_id:
+        conversation_id_var.set(conversation_id)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the correlation ids onto the record while still in the caller's context"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.conversation_id = conversation_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["requestId"] = record.request_id
+        if getattr(record, "conversation_id", None):
+            entry["conversationId"] = record.conversation_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in ("request_id", "conversation_id"):
+                entry[key] = value
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        conversation_id = getattr(record, "conversation_id", None)
+        return f"{line} [{conversation_id}]" if conversation_id else line
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> logging.handlers.QueueListener:
+    """Route all logging through a queue to a stdout writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if (fmt or os.getenv("LOG_FORMAT", "json")) == "text" else JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+
+    # uvicorn's loggers write to stdout synchronously; send them through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger = logging.getLogger(name)
+        logger.handlers = []
+        logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush what is still queued
+    return _listener
+
+
+class RequestContextMiddleware:
+    """Give every HTTP request a correlation id (X-Request-ID, echoed back)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming[:64] or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+        conversation_token = conversation_id_var.set(None)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            conversation_id_var.reset(conversation_token)
+            request_id_var.reset(token)
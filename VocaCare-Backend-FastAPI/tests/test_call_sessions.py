@@ -0,0 +1,99 @@
+"""CallSessions seq handling against an in-memory MongoDB (mongomock-motor)"""
+
+import asyncio
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from call_sessions import CallSessions
+from transcripts import TranscriptStore
+from write_behind import BatchWriter
+
+TURNS = [{"role": "user", "message": "I have chest pain"}]
+
+
+def make_sessions(queue_size: int = 10):
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    writer = BatchWriter(db.patient_transcripts, queue_size=queue_size, enqueue_timeout=0.01)
+    sessions = CallSessions(db.patient_registrations, TranscriptStore(db.patient_transcripts, codec="gzip"), writer)
+    return db, writer, sessions
+
+
+def queued_seqs(writer: BatchWriter) -> list:
+    return [document["seq"] for _, document in list(writer.queue._queue)]
+
+
+def test_chunks_apply_in_order_and_retries_are_ignored():
+    async def run():
+        db, writer, sessions = make_sessions()
+        results = [await sessions.append_transcript("c1", seq, TURNS) for seq in (0, 1, 1, 0, 2)]
+        assert results == [True, True, False, False, True]
+        assert queued_seqs(writer) == [0, 1, 2]
+        assert await db.patient_registrations.count_documents({}) == 1
+        record = await db.patient_registrations.find_one()
+        assert record["transcriptRef"]["lastSeq"] == 2
+        assert record["transcriptRef"]["turns"] == 3
+        assert record["status"] == "in_progress"
+
+    asyncio.run(run())
+
+
+def test_stale_seq_does_not_insert_a_second_registration():
+    async def run():
+        db, writer, sessions = make_sessions()
+        await sessions.update_fields("c1", {"name": "Ann"})
+        assert await sessions.append_transcript("c1", 0, TURNS)
+        assert not await sessions.append_transcript("c1", 0, TURNS)
+        assert await db.patient_registrations.count_documents({"conversationId": "c1"}) == 1
+
+    asyncio.run(run())
+
+
+def test_retried_seq_is_stored_after_the_queue_was_full():
+    async def run():
+        db, writer, sessions = make_sessions(queue_size=1)
+        assert await sessions.append_transcript("c1", 0, TURNS)
+        # The writer is not running, so the queue stays full
+        with pytest.raises(asyncio.QueueFull):
+            await sessions.append_transcript("c1", 1, TURNS)
+        record = await db.patient_registrations.find_one()
+        assert record["transcriptRef"]["lastSeq"] == 0
+        assert record["transcriptRef"]["turns"] == 1
+
+        await writer.queue.get()
+        assert await sessions.append_transcript("c1", 1, TURNS)
+        assert queued_seqs(writer) == [1]
+        record = await db.patient_registrations.find_one()
+        assert record["transcriptRef"]["lastSeq"] == 1
+        assert record["transcriptRef"]["turns"] == 2
+
+    asyncio.run(run())
+
+
+def test_first_chunk_is_retried_after_the_queue_was_full():
+    async def run():
+        db, writer, sessions = make_sessions(queue_size=1)
+        await writer.queue.put((0, {"seq": -1}))
+        with pytest.raises(asyncio.QueueFull):
+            await sessions.append_transcript("c1", 0, TURNS)
+        await writer.queue.get()
+        assert await sessions.append_transcript("c1", 0, TURNS)
+        assert queued_seqs(writer) == [0]
+
+    asyncio.run(run())
+
+
+def test_registration_is_counted_once_when_created():
+    async def run():
+        db, writer, sessions = make_sessions()
+        inserted = []
+        sessions.on_insert = inserted.extend
+        registration = await sessions.update_fields("c1", {"name": "Ann"})
+        assert registration["name"] == "Ann"
+        await sessions.update_fields("c1", {"age": "40"})
+        await sessions.append_transcript("c1", 0, TURNS)
+        await sessions.append_transcript("c2", 0, TURNS)
+        assert [document["conversationId"] for document in inserted] == ["c1", "c2"]
+
+    asyncio.run(run())
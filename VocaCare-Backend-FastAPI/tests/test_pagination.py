@@ -0,0 +1,108 @@
+"""Keyset cursors and paging order across the storage backends"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from pagination import SORT_ORDER, decode_cursor, encode_cursor, keyset_filter
+from storage import MemoryStorage, SQLiteStorage
+
+CREATED = [
+    datetime(2026, 3, 1, 9, 0),
+    datetime(2026, 3, 1, 9, 0),  # same instant: _id breaks the tie
+    datetime(2026, 3, 2, 14, 30),
+    None,  # legacy rows without createdAt
+    datetime(2026, 2, 27, 8, 15),
+    None,
+]
+
+
+def make_records() -> list:
+    records = []
+    for i, created_at in enumerate(CREATED):
+        record = {"_id": ObjectId(), "conversationId": f"c{i}", "name": f"Patient {i}"}
+        if created_at:
+            record["createdAt"] = created_at
+        records.append(record)
+    return records
+
+
+def newest_first(records: list) -> list:
+    """(createdAt, _id) descending, rows without createdAt last"""
+    dated = sorted((r for r in records if "createdAt" in r), key=lambda r: (r["createdAt"], r["_id"]), reverse=True)
+    undated = sorted((r for r in records if "createdAt" not in r), key=lambda r: r["_id"], reverse=True)
+    return [r["conversationId"] for r in dated + undated]
+
+
+def test_cursor_round_trip():
+    record = {"_id": ObjectId(), "createdAt": datetime(2026, 3, 1, 9, 0, 5, 120000)}
+    assert decode_cursor(encode_cursor(record)) == (record["createdAt"], record["_id"])
+    legacy = {"_id": ObjectId()}
+    assert decode_cursor(encode_cursor(legacy)) == (None, legacy["_id"])
+
+
+@pytest.mark.parametrize("token", ["", "not-a-cursor", "e30", "eyJ0IjpudWxsLCJpZCI6Inh4In0"])
+def test_malformed_cursor_raises_value_error(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+async def page_through(storage, limit: int) -> list:
+    seen, cursor = [], None
+    while True:
+        page, cursor = await storage.list(limit, cursor, {"conversationId": 1})
+        seen.extend(record["conversationId"] for record in page)
+        if cursor is None:
+            return seen
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryStorage()
+        return
+    storage = SQLiteStorage(str(tmp_path / "patients.db"))
+    asyncio.run(storage.start())
+    yield storage
+    asyncio.run(storage.close())
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 10])
+def test_pages_cover_every_record_once_in_order(storage, limit):
+    records = make_records()
+
+    async def run():
+        await storage.insert_many([dict(record) for record in records])
+        return await page_through(storage, limit)
+
+    assert asyncio.run(run()) == newest_first(records)
+
+
+def test_iterate_is_oldest_first_with_undated_rows_first(storage):
+    records = make_records()
+
+    async def run():
+        await storage.insert_many([dict(record) for record in records])
+        return [record["conversationId"] async for record in storage.iterate(None, None, {"conversationId": 1})]
+
+    assert asyncio.run(run()) == list(reversed(newest_first(records)))
+
+
+def test_keyset_filter_pages_a_mongo_collection():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    records = make_records()
+
+    async def run():
+        collection = mongomock_motor.AsyncMongoMockClient()["test"].patient_registrations
+        await collection.insert_many([dict(record) for record in records])
+        seen, query = [], {}
+        while True:
+            page = await collection.find(query).sort(SORT_ORDER).limit(3).to_list(None)
+            if not page:
+                return seen
+            seen.extend(record["conversationId"] for record in page)
+            query = keyset_filter(encode_cursor(page[-1]))
+
+    assert asyncio.run(run()) == newest_first(records)
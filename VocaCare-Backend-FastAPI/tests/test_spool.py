@@ -0,0 +1,175 @@
+"""Spool journaling, replay and checkpoint recovery"""
+
+import asyncio
+import os
+
+import pytest
+
+from spool import HEADER, Spool
+
+
+def make_spool(directory, **kwargs) -> Spool:
+    return Spool(str(directory), fsync_interval=0.001, **kwargs)
+
+
+class Collector:
+    """replay() handler that stores every entry unless told to fail"""
+
+    def __init__(self, fail: bool = False):
+        self.entries = []
+        self.fail = fail
+
+    async def __call__(self, entries: list) -> int:
+        if self.fail:
+            raise RuntimeError("database down")
+        self.entries.extend(entries)
+        return len(entries)
+
+    def payloads(self) -> list:
+        return [payload for _, payload in self.entries]
+
+
+async def replay(spool: Spool, handle: Collector, **kwargs) -> int:
+    """replay() only takes entries received before the current millisecond"""
+    await asyncio.sleep(0.002)
+    return await spool.replay(handle, **kwargs)
+
+
+def test_replay_returns_appended_payloads_once(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path)
+        await spool.open()
+        for i in range(3):
+            await spool.append(b"record-%d" % i)
+        handle = Collector()
+        assert await replay(spool, handle) == 3
+        assert handle.payloads() == [b"record-0", b"record-1", b"record-2"]
+        # The checkpoint moved past them
+        assert await replay(spool, handle) == 0
+        await spool.append(b"record-3")
+        assert await replay(spool, handle) == 1
+        assert handle.payloads()[-1] == b"record-3"
+        await spool.close()
+
+    asyncio.run(run())
+
+
+def test_failed_replay_keeps_the_checkpoint(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path, durability="write")
+        await spool.open()
+        await spool.append(b"record-0")
+        with pytest.raises(RuntimeError):
+            await replay(spool, Collector(fail=True))
+        assert spool.checkpoint == (0, 0)
+        handle = Collector()
+        assert await replay(spool, handle) == 1
+        assert handle.payloads() == [b"record-0"]
+        await spool.close()
+
+    asyncio.run(run())
+
+
+def test_restart_resumes_after_the_checkpoint(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path, durability="write")
+        await spool.open()
+        await spool.append(b"replayed")
+        await replay(spool, Collector())
+        await spool.append(b"pending")
+        await spool.close()
+
+        restarted = make_spool(tmp_path, durability="write")
+        await restarted.open()
+        handle = Collector()
+        assert await replay(restarted, handle) == 1
+        assert handle.payloads() == [b"pending"]
+        await restarted.close()
+
+    asyncio.run(run())
+
+
+def test_min_age_leaves_recent_entries_for_later(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path, durability="write")
+        await spool.open()
+        await spool.append(b"old", received_ms=1)
+        await spool.append(b"new")
+        handle = Collector()
+        assert await replay(spool, handle, min_age=60) == 1
+        assert handle.payloads() == [b"old"]
+        await spool.close()
+
+    asyncio.run(run())
+
+
+def test_replay_crosses_segments_and_removes_finished_ones(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path, durability="write", segment_bytes=64)
+        await spool.open()
+        payloads = [b"x" * 40 + b"%d" % i for i in range(4)]
+        for payload in payloads:
+            await spool.append(payload)
+        assert len(spool.segments()) == 4
+        handle = Collector()
+        assert await replay(spool, handle, batch_size=3) == 4
+        assert handle.payloads() == payloads
+        # Only the segment still being appended to is kept
+        assert spool.segments() == [spool._segment]
+        await spool.close()
+
+    asyncio.run(run())
+
+
+def test_torn_tail_is_cut_off_on_open(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path, durability="write")
+        await spool.open()
+        await spool.append(b"intact")
+        path = spool._path(spool._segment)
+        await spool.close()
+        # A crash in the middle of the next record
+        with open(path, "ab") as f:
+            f.write(HEADER.pack(100, 0, 1) + b"partial")
+
+        restarted = make_spool(tmp_path, durability="write")
+        await restarted.open()
+        await restarted.append(b"after restart")
+        handle = Collector()
+        assert await replay(restarted, handle) == 2
+        assert handle.payloads() == [b"intact", b"after restart"]
+        await restarted.close()
+
+    asyncio.run(run())
+
+
+def test_staged_record_is_committed_as_one_entry(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path)
+        await spool.open()
+        staged = spool.stage()
+        staged.write(b'{"conversation_id": ')
+        staged.write(b'"c1"}')
+        await spool.append(b"other")
+        await staged.commit()
+        assert not os.path.exists(staged.path)
+        handle = Collector()
+        assert await replay(spool, handle) == 2
+        assert handle.payloads() == [b"other", b'{"conversation_id": "c1"}']
+        await spool.close()
+
+    asyncio.run(run())
+
+
+def test_discarded_staged_record_leaves_no_entry(tmp_path):
+    async def run():
+        spool = make_spool(tmp_path, durability="write")
+        await spool.open()
+        staged = spool.stage()
+        staged.write(b"abandoned")
+        staged.discard()
+        assert not os.path.exists(staged.path)
+        assert await replay(spool, Collector()) == 0
+        await spool.close()
+
+    asyncio.run(run())
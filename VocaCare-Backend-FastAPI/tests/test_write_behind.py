@@ -0,0 +1,129 @@
+"""BatchWriter flushing and error handling against the memory backend"""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from storage import MemoryStorage
+from write_behind import BatchWriter
+
+
+def make_writer(collection, **kwargs) -> BatchWriter:
+    return BatchWriter(collection, flush_interval=0.01, **kwargs)
+
+
+def queued(documents: list) -> list:
+    """_flush batches are (enqueued_at, document) pairs"""
+    return [(0.0, document) for document in documents]
+
+
+def test_flush_saves_batch_and_notifies_listeners():
+    async def run():
+        storage = MemoryStorage()
+        writer = make_writer(storage)
+        seen = []
+        writer.add_listener(seen.extend)
+        await writer._flush(queued([{"conversationId": "c1"}, {"conversationId": "c2"}]))
+        assert await storage.count() == 2
+        assert [document["conversationId"] for document in seen] == ["c1", "c2"]
+        assert writer.metrics()["written"] == 2
+        assert writer.metrics()["batches"] == 1
+
+    asyncio.run(run())
+
+
+def test_flush_counts_duplicates_and_keeps_the_rest():
+    async def run():
+        storage = MemoryStorage()
+        await storage.insert_many([{"conversationId": "c1"}])
+        writer = make_writer(storage)
+        seen = []
+        writer.add_listener(seen.extend)
+        await writer._flush(queued([{"conversationId": "c1"}, {"conversationId": "c2"}]))
+        assert await storage.count() == 2
+        assert [document["conversationId"] for document in seen] == ["c2"]
+        assert writer.duplicates == 1
+        assert writer.failed == 0
+        assert writer.written == 1
+
+    asyncio.run(run())
+
+
+def test_flush_drops_batch_after_max_retries():
+    async def run():
+        collection = AsyncMock()
+        collection.insert_many.side_effect = OperationFailure("write rejected")
+        writer = make_writer(collection, max_retries=1)
+        seen = []
+        writer.add_listener(seen.extend)
+        await writer._flush(queued([{"conversationId": "c1"}]))
+        assert collection.insert_many.await_count == 2
+        assert writer.failed == 1
+        assert writer.written == 0
+        assert seen == []
+
+    asyncio.run(run())
+
+
+def test_flush_holds_batch_through_an_outage():
+    async def run():
+        collection = AsyncMock()
+        collection.insert_many.side_effect = [AutoReconnect("down"), AutoReconnect("down"), None]
+        writer = make_writer(collection, max_retries=0)
+        await writer._flush(queued([{"conversationId": "c1"}]))
+        # Connection failures never use up retries
+        assert collection.insert_many.await_count == 3
+        assert writer.written == 1
+        assert writer.failed == 0
+        assert not writer.stalled
+
+    asyncio.run(run())
+
+
+def test_stop_drops_batch_when_storage_is_down():
+    async def run():
+        collection = AsyncMock()
+        collection.insert_many.side_effect = AutoReconnect("down")
+        writer = make_writer(collection)
+        await writer.start()
+        await writer.put({"conversationId": "c1"})
+        await asyncio.sleep(0.05)
+        assert writer.stalled
+        await asyncio.wait_for(writer.stop(), 1)
+        assert writer.failed == 1
+        assert not writer.stalled
+
+    asyncio.run(run())
+
+
+def test_full_queue_fails_fast_while_stalled():
+    async def run():
+        writer = make_writer(MemoryStorage(), queue_size=1, enqueue_timeout=5)
+        await writer.put({"conversationId": "c1"})
+        writer.stalled = True
+        with pytest.raises(asyncio.QueueFull):
+            await asyncio.wait_for(writer.put({"conversationId": "c2"}), 0.5)
+
+    asyncio.run(run())
+
+
+def test_inserted_only_listeners_skip_updates():
+    writer = make_writer(MemoryStorage())
+    everything, inserted = [], []
+    writer.add_listener(everything.extend)
+    writer.add_listener(inserted.extend, inserted_only=True)
+    writer.notify([{"conversationId": "c1"}], inserted=False)
+    writer.notify([{"conversationId": "c2"}])
+    assert [document["conversationId"] for document in everything] == ["c1", "c2"]
+    assert [document["conversationId"] for document in inserted] == ["c2"]
+
+
+def test_failing_listener_does_not_block_the_others():
+    writer = make_writer(MemoryStorage())
+    seen = []
+    writer.add_listener(lambda documents: 1 / 0)
+    writer.add_listener(seen.extend)
+    writer.notify([{"conversationId": "c1"}])
+    assert len(seen) == 1
@@ -0,0 +1,194 @@
+"""
+Compressed transcript storage
+Transcripts live in the patient_transcripts collection, keyed by
+conversationId, as compressed chunks (zstd when the `zstandard` package is
+installed, gzip otherwise). Registration documents only keep a small
+transcriptRef, so list and lookup queries never read transcript bytes.
+
+Move transcripts embedded by older versions out of patient_registrations
+(this also fills in their search keywords):
+
+    python transcripts.py --migrate
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+import orjson
+from bson import Binary
+
+from search import MAX_KEYWORDS, transcript_keywords
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Chunks larger than this are compressed in a worker thread
+OFFLOAD_BYTES = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _compress(codec: str, raw: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(raw)
+    return gzip.compress(raw, compresslevel=6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Transcript is zstd-compressed. Run: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class TranscriptStore:
+    """Encode, store and lazily load compressed transcript chunks"""
+
+    def __init__(self, collection, codec: Optional[str] = None,
+                 load_chunks: Optional[Callable[[str], Awaitable[list]]] = None):
+        self.collection = collection
+        # Storage backends other than MongoDB supply their own chunk reader
+        self.load_chunks = load_chunks or self._find_chunks
+        codec = codec or os.getenv("TRANSCRIPT_CODEC") or ("zstd" if zstandard else "gzip")
+        if codec == "zstd" and zstandard is None:
+            logger.warning("⚠️ zstandard not installed, compressing transcripts with gzip")
+            codec = "gzip"
+        self.codec = codec
+
+    async def encode(self, conversation_id: str, turns: list, seq: int = 0) -> dict:
+        """Build a patient_transcripts chunk document for `turns`"""
+        raw = orjson.dumps(turns)
+        if len(raw) > OFFLOAD_BYTES:
+            data = await asyncio.to_thread(_compress, self.codec, raw)
+        else:
+            data = _compress(self.codec, raw)
+        return {
+            "conversationId": conversation_id,
+            "seq": seq,
+            "codec": self.codec,
+            "data": Binary(data),
+            "turns": len(turns),
+            "rawBytes": len(raw),
+            "createdAt": datetime.now(),
+        }
+
+    async def get(self, conversation_id: str) -> Optional[list]:
+        """Decompress and concatenate every chunk, or None if there are none"""
+        chunks = await self.load_chunks(conversation_id)
+        if not chunks:
+            return None
+        turns = []
+        for chunk in chunks:
+            turns.extend(orjson.loads(_decompress(chunk["codec"], chunk["data"])))
+        return turns
+
+    async def _find_chunks(self, conversation_id: str) -> list:
+        cursor = self.collection.find({"conversationId": conversation_id}).sort("seq", 1)
+        return await cursor.to_list(length=None)
+
+
+def transcript_ref(chunk: dict, chunks: int = 1) -> dict:
+    """The pointer kept on the registration document for a transcript stored as `chunks` chunks"""
+    return {
+        "collection": "patient_transcripts",
+        "turns": chunk["turns"],
+        "codec": chunk["codec"],
+        # Same shape as TranscriptStream.ref(), so seq checks treat migrated records alike
+        "lastSeq": chunks - 1,
+    }
+
+
+class TranscriptStream:
+    """
+    Encode transcript turns into seq-numbered chunks while they are parsed
+    Turns are held until a conversationId is known and at most `chunk_turns`
+    at a time, so a long call never has its whole transcript in memory.
+    Each finished chunk is handed to `emit`.
+    """
+
+    def __init__(self, store: TranscriptStore, emit: Callable[[dict], Awaitable],
+                 chunk_turns: int = 200):
+        self.store = store
+        self.emit = emit
+        self.chunk_turns = chunk_turns
+        self.turns = 0
+        self.chunks = 0
+        self._pending: list = []
+        self._keywords: dict = {}
+
+    async def add(self, turns: list, conversation_id: Optional[str]):
+        self._pending.extend(turns)
+        self.turns += len(turns)
+        if len(self._keywords) < MAX_KEYWORDS:
+            for keyword in transcript_keywords(turns):
+                self._keywords.setdefault(keyword, None)
+        if conversation_id:
+            while len(self._pending) >= self.chunk_turns:
+                await self._flush(conversation_id)
+
+    async def finish(self, conversation_id: Optional[str]):
+        """Emit the remaining turns (dropped when the call has no conversationId)"""
+        while conversation_id and self._pending:
+            await self._flush(conversation_id)
+        self._pending = []
+
+    async def _flush(self, conversation_id: str):
+        size = self.chunk_turns
+        batch, self._pending = self._pending[:size], self._pending[size:]
+        await self.emit(await self.store.encode(conversation_id, batch, seq=self.chunks))
+        self.chunks += 1
+
+    @property
+    def keywords(self) -> list:
+        return list(self._keywords)[:MAX_KEYWORDS]
+
+    def ref(self) -> dict:
+        """transcriptRef for every chunk emitted"""
+        return {
+            "collection": "patient_transcripts",
+            "turns": self.turns,
+            "codec": self.store.codec,
+            "lastSeq": self.chunks - 1,
+        }
+
+
+async def migrate_embedded(registrations, store: TranscriptStore, batch_size: int = 200) -> int:
+    """Move embedded `transcript` arrays into the store, batch by batch"""
+    migrated = 0
+    while True:
+        batch = await registrations.find(
+            {"transcript": {"$exists": True}}, {"conversationId": 1, "transcript": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return migrated
+        for record in batch:
+            update = {"$unset": {"transcript": ""}}
+            if record.get("transcript") and record.get("conversationId"):
+                chunk = await store.encode(record["conversationId"], record["transcript"])
+                key = {"conversationId": chunk.pop("conversationId"), "seq": chunk.pop("seq")}
+                await store.collection.update_one(key, {"$setOnInsert": chunk}, upsert=True)
+                update["$set"] = {
+                    "transcriptRef": transcript_ref(chunk),
+                    "transcriptKeywords": transcript_keywords(record["transcript"]),
+                }
+            await registrations.update_one({"_id": record["_id"]}, update)
+            migrated += 1
+        print(f"📦 Migrated {migrated} transcript(s)...")
+
+
+if __name__ == "__main__":
+    if "--migrate" in sys.argv:
+        from database import patient_registrations, patient_transcripts
+
+        total = asyncio.run(migrate_embedded(patient_registrations, TranscriptStore(patient_transcripts)))
+        print(f"✅ Migrated {total} transcript(s)")
+    else:
+        print(__doc__)
@@ -0,0 +1,185 @@
+"""
+Write-behind batching for registrations and transcript chunks
+Webhooks enqueue records and return; a background task flushes them to the
+storage backend with insert_many by batch size or flush interval. While the
+backend is unreachable the current batch is held (not retried away) and the queue
+absorbs new records; once it is full, put() fails immediately.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+DUPLICATE_KEY = 11000
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """Background writer that batches inserts into one round-trip"""
+
+    def __init__(
+        self,
+        collection,
+        batch_size: int = 100,
+        flush_interval: float = 0.25,
+        queue_size: int = 5000,
+        enqueue_timeout: float = 5.0,
+        max_retries: int = 3,
+    ):
+        self.collection = collection
+        # Storage backend or collection name, for logs
+        self.target = getattr(collection, "name", type(collection).__name__)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Tuple[Callable[[list], None], bool]] = []
+        self._stopping = False
+        # Holding a batch until the database comes back
+        self.stalled = False
+
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_lag_ms = 0.0
+        self.max_flush_lag_ms = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task"""
+        if self._task is None:
+            return
+        self._stopping = True
+        await self.queue.put(_STOP)
+        await self._task
+        self._task = None
+        self._stopping = False
+
+    def add_listener(self, callback: Callable[[list], None], inserted_only: bool = False):
+        """
+        Call `callback(documents)` with every batch that reached storage
+        `inserted_only` listeners (counters) are skipped for documents that
+        were updated in place rather than inserted, see notify().
+        """
+        self._listeners.append((callback, inserted_only))
+
+    def notify(self, documents: list, inserted: bool = True):
+        """Run the listeners for documents saved outside the queue (`inserted` False if they already existed)"""
+        for listener, inserted_only in self._listeners:
+            if inserted_only and not inserted:
+                continue
+            try:
+                listener(documents)
+            except Exception as e:
+                logger.warning(f"⚠️ Write listener failed: {e}")
+
+    async def put(self, document: dict):
+        """
+        Queue a document for insertion
+        Waits while the queue is full (backpressure) and raises
+        asyncio.QueueFull if no room frees up within enqueue_timeout, or at
+        once if the queue is full because the database is unavailable
+        """
+        if self.stalled and self.queue.full():
+            raise asyncio.QueueFull("write-behind queue is full and the database is unavailable")
+        try:
+            await asyncio.wait_for(
+                self.queue.put((time.monotonic(), document)), self.enqueue_timeout
+            )
+        except asyncio.TimeoutError:
+            raise asyncio.QueueFull("write-behind queue is full") from None
+        self.enqueued += 1
+
+    def metrics(self) -> dict:
+        return {
+            "pending": self.queue.qsize(),
+            "stalled": self.stalled,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_lag_ms": round(self.last_flush_lag_ms, 2),
+            "max_flush_lag_ms": round(self.max_flush_lag_ms, 2),
+        }
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = item[0] + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = (
+                        self.queue.get_nowait()
+                        if timeout <= 0
+                        else await asyncio.wait_for(self.queue.get(), timeout)
+                    )
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        documents = [document for _, document in batch]
+        attempt = 0
+        while True:
+            try:
+                await self.collection.insert_many(documents, ordered=False)
+                saved = documents
+                self.stalled = False
+                break
+            except ConnectionFailure:
+                # Outages (including an open circuit) do not use up retries;
+                # give up only when shutting down
+                if self._stopping:
+                    self.failed += len(documents)
+                    logger.error(f"⚠️ {self.target} unavailable at shutdown, dropping {len(documents)} record(s)")
+                    self.stalled = False
+                    return
+                self.stalled = True
+                await asyncio.sleep(self.flush_interval * 4)
+            except BulkWriteError as e:
+                # Unordered inserts: everything except the reported errors landed
+                errors = e.details.get("writeErrors", [])
+                duplicates = sum(1 for err in errors if err.get("code") == DUPLICATE_KEY)
+                rejected = {err["index"] for err in errors}
+                saved = [doc for i, doc in enumerate(documents) if i not in rejected]
+                self.duplicates += duplicates
+                self.failed += len(errors) - duplicates
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(documents)
+                    logger.error(f"⚠️ {self.target} batch insert failed, dropping {len(documents)} record(s): {e}")
+                    return
+                await asyncio.sleep(min(2 ** attempt * 0.5, 5))
+                attempt += 1
+
+        self.written += len(saved)
+        self.batches += 1
+        lag_ms = (time.monotonic() - batch[0][0]) * 1000
+        self.last_flush_lag_ms = lag_ms
+        self.max_flush_lag_ms = max(self.max_flush_lag_ms, lag_ms)
+        logger.info(f"💾 Saved {len(saved)} record(s) to {self.target} (flush lag {lag_ms:.0f} ms)")
+        self.notify(saved)